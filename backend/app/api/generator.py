@@ -1,69 +1,198 @@
 """
 生成器 API - 项目生成和下载
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import Dict, Any
-from pathlib import Path
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, Optional, Tuple, Literal
+import re
 
-from app.core.engine import GeneratorEngine
+from app.core.engine import get_engine
+from app.core.delta import DeltaUnavailable, ProjectChanged, diff_projects, build_delta_archive
+from app.core.admission import get_admission_controller, client_key
+from app.core.storage import is_generated_project_id
 from app.config import get_settings
+from app.utils.http_cache import etag_matches
 
 router = APIRouter()
-engine = GeneratorEngine()
 settings = get_settings()
 
 
 class GenerateRequest(BaseModel):
     module_id: str
     config: Dict[str, Any] = {}
+    priority: Literal["interactive", "batch"] = "interactive"  # 批量脚本请用 batch
+    deadline: Optional[float] = Field(None, gt=0)  # 最长排队秒数
 
 
 @router.post("/generate")
-async def generate_project(request: GenerateRequest):
+async def generate_project(request: GenerateRequest, http_request: Request):
     """生成项目"""
-    result = await engine.generate(
+    admission = get_admission_controller().ticket(
+        client_key(http_request), request.priority, request.deadline
+    )
+    result = await get_engine().generate(
         module_id=request.module_id,
-        config=request.config
+        config=request.config,
+        admission=admission
     )
     return result.to_dict()
 
 
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单区间 Range 头
+    
+    Returns:
+        [start, end) 区间；无法满足时返回 None
+    """
+    m = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if not m.group(1):
+        # 后缀区间: bytes=-500
+        length = int(m.group(2))
+        if length == 0:
+            return None
+        return max(size - length, 0), size
+    start = int(m.group(1))
+    end = int(m.group(2)) + 1 if m.group(2) else size
+    if start >= size or end <= start:
+        return None
+    return start, min(end, size)
+
+
 @router.get("/download/{project_id}")
-async def download_project(project_id: str):
-    """下载生成的项目ZIP"""
-    zip_path = settings.OUTPUT_DIR / f"{project_id}.zip"
+async def download_project(project_id: str, request: Request):
+    """
+    下载生成的项目ZIP
+    
+    支持 ETag 条件请求(304)与 Range 断点续传(206)；本地文件的区间请求交给
+    FileResponse，其他后端按单区间从存储流式读取。
+    """
+    # 存储查询可能阻塞 (sqlite 锁等待)，放到线程池中执行
+    archive = await run_in_threadpool(get_engine().store.get_archive, project_id)
+    
+    if archive is None:
+        raise HTTPException(status_code=404, detail="项目不存在或已过期")
+    
+    filename = f"{project_id}.zip"
+    # 项目属于个人，不允许共享缓存保存；指定ID可能被重新发布，每次都需用 ETag 验证
+    if is_generated_project_id(project_id):
+        cache_control = f"private, max-age={settings.OUTPUT_RETENTION_DAYS * 86400}"
+    else:
+        cache_control = "private, no-cache"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+    }
+    etag = f'"{archive.sha256}"' if archive.sha256 else None
+    if etag:
+        headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    
+    if archive.path is not None:
+        # 本地文件走 sendfile，零拷贝；Range / If-Range 由 FileResponse 处理
+        return FileResponse(
+            path=str(archive.path),
+            filename=filename,
+            media_type="application/zip",
+            headers=headers
+        )
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    use_range = range_header is not None and (
+        if_range is None or (etag is not None and etag_matches(if_range, etag))
+    )
+    
+    if use_range:
+        byte_range = _parse_range(range_header, archive.size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{archive.size}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{archive.size}"
+        headers["Content-Length"] = str(end - start)
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return StreamingResponse(
+            archive.iter_chunks(start, end),
+            status_code=206,
+            media_type="application/zip",
+            headers=headers
+        )
+    
+    headers["Content-Length"] = str(archive.size)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        archive.iter_chunks(),
+        media_type="application/zip",
+        headers=headers
+    )
+
+
+@router.get("/delta/{base_id}/{project_id}")
+async def download_delta(base_id: str, project_id: str, request: Request, format: str = "zip"):
+    """
+    下载两次生成之间的增量包
     
-    if not zip_path.exists():
+    ZIP 中只包含相对 base_id 新增与变更的文件，删除列表记录在
+    .generator-delta.json 中；format=json 时只返回差异清单。
+    """
+    if format not in ("zip", "json"):
+        raise HTTPException(status_code=400, detail="format 只支持 zip 或 json")
+    
+    store = get_engine().store
+    try:
+        delta = await run_in_threadpool(diff_projects, store, base_id, project_id)
+    except DeltaUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if delta is None:
         raise HTTPException(status_code=404, detail="项目不存在或已过期")
     
+    if format == "json":
+        return delta.to_dict()
+    
+    etag = f'"{delta.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    staging_dir = store.new_staging_dir("delta")
+    zip_path = staging_dir / "delta.zip"
+    try:
+        await run_in_threadpool(build_delta_archive, store, delta, zip_path)
+    except (FileNotFoundError, ProjectChanged):
+        # 打包期间项目被重新生成或清理
+        store.discard(staging_dir)
+        raise HTTPException(status_code=409, detail="项目已变更，请重试")
+    except Exception:
+        store.discard(staging_dir)
+        raise
+    
     return FileResponse(
         path=str(zip_path),
-        filename=f"{project_id}.zip",
-        media_type="application/zip"
+        filename=f"{base_id}..{project_id}.zip",
+        media_type="application/zip",
+        headers=headers,
+        background=BackgroundTask(store.discard, staging_dir)
     )
 
 
 @router.get("/preview/{project_id}")
 async def preview_project(project_id: str):
     """预览项目文件结构"""
-    project_dir = settings.OUTPUT_DIR / project_id
+    files = await run_in_threadpool(get_engine().store.list_files, project_id)
     
-    if not project_dir.exists():
+    if files is None:
         raise HTTPException(status_code=404, detail="项目不存在")
     
-    files = []
-    for item in project_dir.rglob("*"):
-        rel_path = item.relative_to(project_dir)
-        files.append({
-            "path": str(rel_path),
-            "name": item.name,
-            "type": "directory" if item.is_dir() else "file",
-            "size": item.stat().st_size if item.is_file() else None
-        })
-    
     return {
         "project_id": project_id,
-        "files": sorted(files, key=lambda x: (x["type"] == "file", x["path"]))
+        "files": files
     }
@@ -1,37 +1,61 @@
 """
 内部测试 API
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Literal
 
-from app.core.engine import GeneratorEngine
+from app.core.engine import get_engine
+from app.core.admission import get_admission_controller, client_key
+from app.core.memory import get_memory_tracker, process_memory
+from app.utils.http_cache import cached_json_response
 
 router = APIRouter()
-engine = GeneratorEngine()
 
 
 class QuickTestRequest(BaseModel):
     module_id: str = "student_management"
     config: Dict[str, Any] = {}
+    priority: Literal["interactive", "batch", "background"] = "interactive"
 
 
 @router.get("/status")
-async def get_status():
+async def get_status(request: Request):
     """系统状态"""
-    modules = engine.get_modules()
+    return cached_json_response(request, get_engine().catalogue.snapshot().status)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """运行指标"""
+    return {
+        "admission": get_admission_controller().get_metrics()
+    }
+
+
+@router.get("/memory")
+async def get_memory_report(top: int = 10):
+    """
+    内存报告: 进程内存、各缓存大小、按模块的生成内存记账与分配最多的代码行
+    
+    记账与分配来源需开启 MEMORY_TRACKING。
+    """
+    tracker = get_memory_tracker()
     return {
-        "status": "online",
-        "modules_count": len(modules),
-        "modules": [{"id": m.id, "name": m.name} for m in modules]
+        "process": process_memory(),
+        "caches": get_engine().cache_stats(),
+        "tracking": tracker.report(),
+        "top_allocators": tracker.top_allocators(max(0, min(top, 100)))
     }
 
 
 @router.post("/quick-gen")
-async def quick_generate(request: QuickTestRequest):
+async def quick_generate(request: QuickTestRequest, http_request: Request):
     """快速测试生成"""
-    result = await engine.generate(
+    admission = get_admission_controller().ticket(client_key(http_request), request.priority)
+    result = await get_engine().generate(
         module_id=request.module_id,
-        config=request.config
+        config=request.config,
+        admission=admission
     )
     return result.to_dict()
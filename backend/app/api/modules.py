@@ -1,14 +1,14 @@
 """
 模块管理 API - 从模板加载器获取模块列表
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import List, Dict, Any
 from pydantic import BaseModel
 
-from app.core.engine import GeneratorEngine
+from app.core.engine import get_engine
+from app.utils.http_cache import cached_json_response
 
 router = APIRouter()
-engine = GeneratorEngine()
 
 
 class ModuleResponse(BaseModel):
@@ -23,47 +23,22 @@ class ModuleResponse(BaseModel):
 
 
 @router.get("/", response_model=List[ModuleResponse])
-async def get_all_modules():
+async def get_all_modules(request: Request):
     """获取所有可用模块"""
-    modules = engine.get_modules()
-    return [
-        ModuleResponse(
-            id=m.id,
-            name=m.name,
-            description=m.description,
-            version=m.version,
-            icon=m.icon,
-            category=m.category,
-            tech_stack=m.tech_stack,
-            fields=[f.model_dump() for f in m.fields]
-        )
-        for m in modules
-    ]
+    return cached_json_response(request, get_engine().catalogue.snapshot().modules)
 
 
 @router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """获取所有分类"""
-    modules = engine.get_modules()
-    categories = list(set(m.category for m in modules))
-    return {"categories": categories}
+    return cached_json_response(request, get_engine().catalogue.snapshot().categories)
 
 
 @router.get("/{module_id}")
-async def get_module(module_id: str):
+async def get_module(module_id: str, request: Request):
     """获取单个模块详情"""
-    module = engine.get_module(module_id)
-    if not module:
+    cached = get_engine().catalogue.snapshot().details.get(module_id)
+    if cached is None:
         raise HTTPException(status_code=404, detail=f"模块不存在: {module_id}")
     
-    return {
-        "id": module.id,
-        "name": module.name,
-        "description": module.description,
-        "version": module.version,
-        "icon": module.icon,
-        "category": module.category,
-        "tech_stack": module.tech_stack,
-        "fields": [f.model_dump() for f in module.fields],
-        "files_count": len(module.files)
-    }
+    return cached_json_response(request, cached)
@@ -2,6 +2,7 @@
 配置管理 - 生产级配置系统
 """
 from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 import os
@@ -21,13 +22,46 @@ class Settings(BaseSettings):
     OUTPUT_DIR: Path = BASE_DIR / "output"
     DATA_DIR: Path = BASE_DIR / "data"
     
+    # 产物存储: local / shared / sqlite
+    ARTIFACT_STORE: str = "local"
+    ARTIFACT_SHARED_DIR: Optional[Path] = None
+    ARTIFACT_DB_PATH: Path = DATA_DIR / "artifacts.db"
+    
     # 数据库
     DATABASE_URL: str = "sqlite:///./data/history.db"
     
     # 生成配置
     MAX_CONCURRENT_GENERATIONS: int = 5
+    GENERATION_QUEUE_SIZE: int = 50  # 超过后直接 503
+    GENERATION_QUEUE_TIMEOUT: float = 30.0  # 排队超时 (秒)
+    RATE_LIMIT_PER_MINUTE: float = 20  # 单客户端每分钟生成次数，0 为不限
+    RATE_LIMIT_BURST: int = 5
+    BULK_QUEUE_SIZE: int = 500  # batch / background 各自的排队上限
+    BULK_QUEUE_TIMEOUT: float = 600.0  # batch / background 排队超时 (秒)
+    BULK_RATE_LIMIT_PER_MINUTE: float = 120  # batch / background 单客户端每分钟次数，0 为不限
+    BULK_RATE_LIMIT_BURST: int = 20
+    BULK_QUEUE_PER_CLIENT: int = 20  # batch / background 单客户端排队上限，0 为不限
+    INTERACTIVE_RESERVED_SLOTS: int = 1  # 只给 interactive 使用的并发名额
+    TRUSTED_PROXIES: str = "127.0.0.1,::1"  # 可信反向代理 (逗号分隔的 IP/网段)，只认它们转发的 X-Real-IP
     OUTPUT_RETENTION_DAYS: int = 7
     
+    # 渲染预算 (0 为不限制)
+    RENDER_ISOLATION: str = "thread"  # thread / process
+    TEMPLATE_RENDER_TIMEOUT: float = 10.0  # 单个模板 (秒)
+    GENERATION_RENDER_TIMEOUT: float = 60.0  # 一次生成 (秒)
+    TEMPLATE_MAX_OUTPUT_MB: float = 50
+    GENERATION_MAX_OUTPUT_MB: float = 200
+    RENDER_MEMORY_LIMIT_MB: float = 0  # 仅 process 模式生效
+    RENDER_MAX_STUCK_THREADS: int = 16  # thread 模式下未结束的超时渲染线程上限，达到后快速失败，0 为不限
+    STATIC_HARDLINK: bool = False  # 目录模式静态资源优先硬链接 (资源文件须只读)
+    
+    # 缓存上限与内存记账
+    JINJA_ENV_CACHE_SIZE: int = 32  # 同时保留的模块 Jinja 环境数
+    TEMPLATE_CACHE_SIZE: int = 200  # 每个环境缓存的已编译模板数
+    MAX_MODULES: int = 500  # 超出的模块目录不加载
+    MEMORY_TRACKING: bool = False  # 用 tracemalloc 记录每次生成的内存
+    MEMORY_TRACKING_FRAMES: int = 1  # 分配来源保留的调用栈深度
+    
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/app.log"
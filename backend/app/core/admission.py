@@ -0,0 +1,427 @@
+"""
+准入控制 - 生成接口的并发上限、排队与按客户端限流
+
+- 并发: 同时执行的生成数不超过 MAX_CONCURRENT_GENERATIONS，其余按优先级类进入有界队列，
+  由公平调度器 (app.core.scheduler) 决定执行顺序
+- 队列满或排队超时: 503 + Retry-After
+- 每个优先级类各自的单客户端令牌桶: 超出速率 429 + Retry-After
+- batch / background 单客户端排队数上限: 超出 429 + Retry-After
+
+限制在单进程内生效，多 worker 部署时总容量为各进程之和。
+"""
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from collections import deque
+from typing import Dict, Any, Optional, Deque, Tuple
+import asyncio
+import ipaddress
+import math
+import time
+
+from app.config import get_settings
+from app.core.scheduler import FairScheduler, CLASS_WEIGHTS
+from app.utils.logger import logger
+
+
+# 排队耗时直方图的桶上限 (秒)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 计算 p95 时保留的最近排队样本数
+RECENT_WAIT_SAMPLES = 1000
+
+# 令牌桶数量超过该值时清理已回满的桶
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """令牌桶"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """
+        尝试取一个令牌
+
+        Returns:
+            0 表示成功，否则为距离下一个令牌的秒数
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class _WaitStats:
+    """排队耗时统计: 累计直方图 + 最近样本 (用于 p95)"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.recent: Deque[float] = deque(maxlen=RECENT_WAIT_SAMPLES)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, other: "_WaitStats"):
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.recent.extend(other.recent)
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS, self.buckets)}
+        buckets["le_inf"] = self.buckets[-1]
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "recent_p95": round(p95, 6),
+            "buckets": buckets,
+        }
+
+
+class _ClassState:
+    """
+    单个优先级类的限制与指标
+
+    Args:
+        max_queue: 该类的排队上限
+        queue_timeout: 排队超时 (秒)
+        rate_per_minute: 单客户端每分钟次数，0 为不限
+        burst: 单客户端令牌桶容量
+        max_queue_per_client: 单客户端在该类中的排队上限，0 为不限
+    """
+
+    def __init__(
+        self,
+        max_queue: int,
+        queue_timeout: float,
+        rate_per_minute: float,
+        burst: int,
+        max_queue_per_client: int = 0
+    ):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_queue_per_client = max_queue_per_client
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "client_queue_full": 0, "queue_full": 0, "queue_timeout": 0}
+        self.wait = _WaitStats()
+        # 平均执行耗时 (指数滑动平均)，用于估算 Retry-After
+        self.service_time = 1.0
+
+
+class AdmissionController:
+    """
+    生成请求准入控制器
+
+    Args:
+        max_concurrent: 同时执行的生成数
+        max_queue: interactive 排队上限
+        queue_timeout: interactive 排队超时 (秒)
+        rate_per_minute: interactive 单客户端每分钟次数
+        burst: interactive 令牌桶容量
+        bulk_queue: batch / background 各自的排队上限
+        bulk_timeout: batch / background 排队超时 (秒)
+        bulk_rate_per_minute: batch / background 单客户端每分钟次数 (各自独立计数)
+        bulk_burst: batch / background 令牌桶容量
+        bulk_queue_per_client: batch / background 单客户端排队上限
+        reserved_interactive: 只给 interactive 使用的名额数
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        rate_per_minute: float,
+        burst: int,
+        bulk_queue: int = 500,
+        bulk_timeout: float = 600.0,
+        bulk_rate_per_minute: float = 120,
+        bulk_burst: int = 20,
+        bulk_queue_per_client: int = 20,
+        reserved_interactive: int = 1
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.reserved_interactive = reserved_interactive
+
+        self._scheduler: Optional[FairScheduler] = None
+        # 优先级由请求方声明，每个类都有自己的单客户端限流，改报优先级不能绕过限制
+        self._classes = {
+            "interactive": _ClassState(max_queue, queue_timeout, rate_per_minute, burst),
+            "batch": _ClassState(bulk_queue, bulk_timeout, bulk_rate_per_minute, bulk_burst,
+                                 bulk_queue_per_client),
+            "background": _ClassState(bulk_queue, bulk_timeout, bulk_rate_per_minute, bulk_burst,
+                                      bulk_queue_per_client),
+        }
+
+    def _get_scheduler(self) -> FairScheduler:
+        # 延迟创建，future 绑定到实际运行的事件循环
+        if self._scheduler is None:
+            self._scheduler = FairScheduler(self.max_concurrent, self.reserved_interactive)
+        return self._scheduler
+
+    def _check_rate(self, client: str, state: _ClassState):
+        if state.rate <= 0:
+            return
+        bucket = state.buckets.get(client)
+        if bucket is None:
+            if len(state.buckets) >= MAX_TRACKED_CLIENTS:
+                state.buckets = {k: b for k, b in state.buckets.items() if not b.is_full()}
+            bucket = state.buckets[client] = TokenBucket(state.rate, state.burst)
+        wait = bucket.try_acquire()
+        if wait > 0:
+            state.rejected["rate_limited"] += 1
+            raise AdmissionRejected(429, "请求过于频繁，请稍后再试", wait)
+
+    def _estimate_wait(self, priority: str) -> float:
+        state = self._classes[priority]
+        waiting = self._scheduler.waiting[priority] if self._scheduler else 0
+        return state.service_time * (waiting + 1) / self.max_concurrent
+
+    def _state(self, priority: str) -> _ClassState:
+        state = self._classes.get(priority)
+        if state is None:
+            raise ValueError(f"未知的优先级: {priority}")
+        return state
+
+    def check(self, client: str, priority: str = "interactive", queued: bool = True):
+        """
+        不占名额的准入检查: 按客户端限流；queued 为 True 时 (请求将进入队列)
+        同时检查单客户端排队上限与该类的队列上限
+
+        Raises:
+            AdmissionRejected: 限流 (429) 或过载 (503)
+            ValueError: 未知的优先级类
+        """
+        state = self._state(priority)
+        self._check_rate(client, state)
+        if not queued:
+            return
+
+        scheduler = self._get_scheduler()
+        if state.max_queue_per_client and \
+                scheduler.waiting_for(priority, client) >= state.max_queue_per_client:
+            state.rejected["client_queue_full"] += 1
+            raise AdmissionRejected(429, "排队中的任务过多，请稍后再试", self._estimate_wait(priority))
+        if scheduler.waiting[priority] >= state.max_queue and scheduler.in_use >= scheduler.capacity:
+            state.rejected["queue_full"] += 1
+            raise AdmissionRejected(503, "服务繁忙，请稍后再试", self._estimate_wait(priority))
+
+    @asynccontextmanager
+    async def slot(self, client: str, priority: str = "interactive", deadline: Optional[float] = None):
+        """
+        排队并占用一个执行名额，调用前应已通过 check
+
+        Raises:
+            AdmissionRejected: 排队超时 (503)
+        """
+        state = self._state(priority)
+        scheduler = self._get_scheduler()
+        timeout = state.queue_timeout if deadline is None else min(deadline, state.queue_timeout)
+        queued_at = time.monotonic()
+        try:
+            await scheduler.acquire(client, priority, queued_at + timeout)
+        except asyncio.TimeoutError:
+            state.rejected["queue_timeout"] += 1
+            raise AdmissionRejected(503, "排队超时，请稍后再试", self._estimate_wait(priority))
+
+        started_at = time.monotonic()
+        state.wait.observe(started_at - queued_at)
+        state.admitted += 1
+        try:
+            yield
+        finally:
+            state.service_time = 0.8 * state.service_time + 0.2 * (time.monotonic() - started_at)
+            scheduler.release(priority)
+
+    @asynccontextmanager
+    async def admit(self, client: str, priority: str = "interactive", deadline: Optional[float] = None):
+        """
+        获取一个执行名额，用法:
+
+            async with controller.admit(client_ip):
+                await engine.generate(...)
+
+        每个优先级类分别按客户端限流；batch / background 的速率与排队上限更宽，
+        同时限制单客户端排队数，一个客户端不能占满整个类的队列。
+
+        Args:
+            client: 客户端标识
+            priority: interactive / batch / background
+            deadline: 调用方可接受的最长排队时间 (秒)，不超过该类的排队超时
+
+        Raises:
+            AdmissionRejected: 限流 (429) 或过载 (503)
+            ValueError: 未知的优先级类
+        """
+        self.check(client, priority)
+        async with self.slot(client, priority, deadline):
+            yield
+
+    def ticket(self, client: str, priority: str = "interactive", deadline: Optional[float] = None) -> "Admission":
+        """生成一个请求的准入凭据，交给引擎在合并相同请求前后使用"""
+        self._state(priority)
+        return Admission(self, client, priority, deadline)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """导出准入指标: 顶层为各类合计，classes 下为各优先级类"""
+        scheduler = self._scheduler
+        total_wait = _WaitStats()
+        rejected = {"rate_limited": 0, "client_queue_full": 0, "queue_full": 0, "queue_timeout": 0}
+        classes = {}
+        for priority, state in self._classes.items():
+            total_wait.merge(state.wait)
+            for reason, count in state.rejected.items():
+                rejected[reason] += count
+            classes[priority] = {
+                "weight": CLASS_WEIGHTS[priority],
+                "max_queue": state.max_queue,
+                "queue_timeout": state.queue_timeout,
+                "rate_per_minute": round(state.rate * 60, 3),
+                "max_queue_per_client": state.max_queue_per_client,
+                "tracked_clients": len(state.buckets),
+                "in_flight": scheduler.running[priority] if scheduler else 0,
+                "queued": scheduler.waiting[priority] if scheduler else 0,
+                "queued_clients": scheduler.queued_clients(priority) if scheduler else 0,
+                "admitted_total": state.admitted,
+                "rejected_total": dict(state.rejected),
+                "queue_wait_seconds": state.wait.to_dict(),
+                "avg_service_seconds": round(state.service_time, 4),
+            }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "reserved_interactive": scheduler.reserved if scheduler else self.reserved_interactive,
+            "in_flight": scheduler.in_use if scheduler else 0,
+            "queued": sum(c["queued"] for c in classes.values()),
+            "admitted_total": sum(c["admitted_total"] for c in classes.values()),
+            "rejected_total": rejected,
+            "queue_wait_seconds": total_wait.to_dict(),
+            "tracked_clients": sum(len(state.buckets) for state in self._classes.values()),
+            "classes": classes,
+        }
+
+
+class Admission:
+    """
+    单个请求的准入凭据
+
+    引擎合并相同的生成请求: 每个调用方先以自己的客户端与优先级调用 check，
+    合并到进行中生成的请求只限流 (queued=False)，实际执行的请求再进入 slot 排队。
+    """
+
+    def __init__(self, controller: AdmissionController, client: str, priority: str,
+                 deadline: Optional[float] = None):
+        self.controller = controller
+        self.client = client
+        self.priority = priority
+        self.deadline = deadline
+
+    def check(self, queued: bool = True):
+        self.controller.check(self.client, self.priority, queued)
+
+    def slot(self):
+        return self.controller.slot(self.client, self.priority, self.deadline)
+
+
+@lru_cache()
+def _trusted_proxies() -> Tuple[Any, ...]:
+    """解析 TRUSTED_PROXIES (逗号分隔的 IP 或网段)"""
+    networks = []
+    for item in get_settings().TRUSTED_PROXIES.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning(f"忽略无效的 TRUSTED_PROXIES 项: {item}")
+    return tuple(networks)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_proxies())
+
+
+def client_key(request) -> str:
+    """
+    识别客户端
+
+    直连对端在 TRUSTED_PROXIES 中时取反向代理设置的 X-Real-IP，否则取对端地址；
+    直接暴露的服务若信任该请求头，客户端每次换一个值就能得到新的令牌桶。
+    """
+    peer = request.client.host if request.client else None
+    if peer is None:
+        return "unknown"
+    real_ip = request.headers.get("x-real-ip")
+    if real_ip and _is_trusted_proxy(peer):
+        return real_ip.strip()
+    return peer
+
+
+@lru_cache()
+def get_admission_controller() -> AdmissionController:
+    """获取准入控制器单例，所有生成接口共享"""
+    settings = get_settings()
+    logger.info(
+        f"准入控制: 并发 {settings.MAX_CONCURRENT_GENERATIONS}, 队列 {settings.GENERATION_QUEUE_SIZE}, "
+        f"限流 {settings.RATE_LIMIT_PER_MINUTE}/分钟, 交互保留 {settings.INTERACTIVE_RESERVED_SLOTS}"
+    )
+    return AdmissionController(
+        max_concurrent=settings.MAX_CONCURRENT_GENERATIONS,
+        max_queue=settings.GENERATION_QUEUE_SIZE,
+        queue_timeout=settings.GENERATION_QUEUE_TIMEOUT,
+        rate_per_minute=settings.RATE_LIMIT_PER_MINUTE,
+        burst=settings.RATE_LIMIT_BURST,
+        bulk_queue=settings.BULK_QUEUE_SIZE,
+        bulk_timeout=settings.BULK_QUEUE_TIMEOUT,
+        bulk_rate_per_minute=settings.BULK_RATE_LIMIT_PER_MINUTE,
+        bulk_burst=settings.BULK_RATE_LIMIT_BURST,
+        bulk_queue_per_client=settings.BULK_QUEUE_PER_CLIENT,
+        reserved_interactive=settings.INTERACTIVE_RESERVED_SLOTS
+    )
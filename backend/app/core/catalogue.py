@@ -0,0 +1,67 @@
+"""
+模块目录缓存 - 按目录版本预先序列化只读接口的响应
+"""
+from typing import Any, Dict, Optional
+import hashlib
+import json
+
+from app.core.template_loader import TemplateLoader
+
+
+class CachedJSON:
+    """预先序列化好的 JSON 响应体及其 ETag"""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, data: Any):
+        self.body = json.dumps(
+            data, ensure_ascii=False, separators=(",", ":"), default=str
+        ).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+
+class CatalogueSnapshot:
+    """某一目录版本下所有只读接口的响应"""
+
+    def __init__(self, loader: TemplateLoader):
+        self.version = loader.version
+        modules = loader.get_all_modules()
+
+        summaries = []
+        self.details: Dict[str, CachedJSON] = {}
+        for m in modules:
+            summary = {
+                "id": m.id,
+                "name": m.name,
+                "description": m.description,
+                "version": m.version,
+                "icon": m.icon,
+                "category": m.category,
+                "tech_stack": m.tech_stack,
+                "fields": [f.model_dump() for f in m.fields],
+            }
+            summaries.append(summary)
+            self.details[m.id] = CachedJSON({**summary, "files_count": len(m.files)})
+
+        self.modules = CachedJSON(summaries)
+        self.categories = CachedJSON({
+            "categories": list(dict.fromkeys(m.category for m in modules))
+        })
+        self.status = CachedJSON({
+            "status": "online",
+            "modules_count": len(modules),
+            "modules": [{"id": m.id, "name": m.name} for m in modules],
+        })
+
+
+class Catalogue:
+    """目录缓存，模块重新加载后自动重建"""
+
+    def __init__(self, loader: TemplateLoader):
+        self.loader = loader
+        self._snapshot: Optional[CatalogueSnapshot] = None
+
+    def snapshot(self) -> CatalogueSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self.loader.version:
+            snapshot = self._snapshot = CatalogueSnapshot(self.loader)
+        return snapshot
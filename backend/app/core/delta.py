@@ -0,0 +1,131 @@
+"""
+增量包 - 两次生成结果之间的差异
+
+按生成时记录的文件指纹 (sha256) 比较两个项目的文件清单，不重新读取两棵目录树。
+增量 ZIP 只包含新增与变更的文件，另附 DELTA_MANIFEST 记录删除列表，
+客户端解压覆盖后再删除列出的文件即可得到新项目。
+"""
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import hashlib
+import json
+import zipfile
+
+from app.core.storage import ArtifactStore, CHUNK_SIZE
+
+
+# 增量包内的差异说明文件
+DELTA_MANIFEST = ".generator-delta.json"
+
+
+class DeltaUnavailable(Exception):
+    """缺少文件指纹，无法计算增量"""
+
+
+class ProjectChanged(Exception):
+    """打包期间项目被重新发布，文件内容与比较时的清单不一致"""
+
+
+class ProjectDelta:
+    """两个项目之间的文件差异"""
+    def __init__(
+        self,
+        base_id: str,
+        project_id: str,
+        added: List[Dict[str, Any]],
+        changed: List[Dict[str, Any]],
+        deleted: List[str]
+    ):
+        self.base_id = base_id
+        self.project_id = project_id
+        self.added = added
+        self.changed = changed
+        self.deleted = deleted
+
+    @property
+    def files(self) -> List[Dict[str, Any]]:
+        """需要传输的文件"""
+        return self.added + self.changed
+
+    @property
+    def etag(self) -> str:
+        """由两端文件指纹决定，内容不变则不变"""
+        digest = hashlib.sha256()
+        for entry in self.files:
+            digest.update(f"{entry['path']}\0{entry['sha256']}\n".encode("utf-8"))
+        for path in self.deleted:
+            digest.update(f"-{path}\n".encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "base": self.base_id,
+            "project_id": self.project_id,
+            "added": [e["path"] for e in self.added],
+            "changed": [e["path"] for e in self.changed],
+            "deleted": self.deleted,
+            "size": sum(e["size"] or 0 for e in self.files),
+        }
+
+
+def _file_hashes(manifest: List[Dict[str, Any]], project_id: str) -> Dict[str, Dict[str, Any]]:
+    files = {}
+    for entry in manifest:
+        if entry["type"] != "file":
+            continue
+        if not entry.get("sha256"):
+            raise DeltaUnavailable(f"项目 {project_id} 没有记录文件指纹，请下载完整包")
+        files[entry["path"]] = entry
+    return files
+
+
+def diff_projects(store: ArtifactStore, base_id: str, project_id: str) -> Optional[ProjectDelta]:
+    """
+    比较两个项目的文件清单
+
+    Returns:
+        差异，任一项目不存在时返回 None
+
+    Raises:
+        DeltaUnavailable: 项目由旧版本生成，清单中没有文件指纹
+    """
+    base_manifest = store.list_files(base_id)
+    new_manifest = store.list_files(project_id)
+    if base_manifest is None or new_manifest is None:
+        return None
+
+    base = _file_hashes(base_manifest, base_id)
+    new = _file_hashes(new_manifest, project_id)
+
+    added, changed = [], []
+    for path, entry in new.items():
+        old = base.get(path)
+        if old is None:
+            added.append(entry)
+        elif old["sha256"] != entry["sha256"]:
+            changed.append(entry)
+    deleted = sorted(path for path in base if path not in new)
+    return ProjectDelta(base_id, project_id, added, changed, deleted)
+
+
+def build_delta_archive(store: ArtifactStore, delta: ProjectDelta, zip_path: Path):
+    """
+    把新增与变更的文件及差异说明打包为 ZIP
+
+    逐个文件读取时边写边校验指纹，比较之后项目被重新发布的文件不会混入增量包。
+
+    Raises:
+        FileNotFoundError: 项目或文件已被清理
+        ProjectChanged: 文件内容与清单中的指纹不一致
+    """
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(DELTA_MANIFEST, json.dumps(delta.to_dict(), ensure_ascii=False, indent=2))
+        for entry in delta.files:
+            digest = hashlib.sha256()
+            with store.open_file(delta.project_id, entry["path"]) as src, \
+                    zf.open(entry["path"], "w") as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            if digest.hexdigest() != entry["sha256"]:
+                raise ProjectChanged(entry["path"])
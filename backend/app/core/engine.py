@@ -1,17 +1,43 @@
 """
 生成引擎 v2.0 - 使用文件映射方式
 """
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-import shutil
+from typing import Dict, Any, Optional, List, Set, Tuple, TYPE_CHECKING
+import asyncio
+import hashlib
+import json
+import os
+import threading
 import time
 import uuid
-import re
 
-from jinja2 import Environment, FileSystemLoader
 from app.core.template_loader import TemplateLoader, ModuleDefinition
+from app.core.plan import GenerationPlan, CopyJob
+from app.core.storage import create_artifact_store, build_archive, copy_static, file_sha256
+from app.core.catalogue import Catalogue
+from app.core.memory import BoundedCache, get_memory_tracker
+from app.core.sandbox import (
+    RenderBudget, BudgetTracker, BudgetExceeded,
+    create_jinja_env, render_with_budget, render_isolated
+)
 from app.utils.logger import logger
-from app.config import get_settings
+
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+    from app.core.admission import Admission
+
+
+# 静态资源按批提交到线程池，避免上万个小文件各占一个任务
+STATIC_COPY_BATCH = 64
+
+# 线程模式看门狗: 检查间隔与宽限 (秒)，宽限内优先由渲染线程自己报告越界
+RENDER_WATCHDOG_INTERVAL = 0.5
+RENDER_WATCHDOG_GRACE = 1.0
+
+# 开发模式下检查模板是否修改的最小间隔 (秒)，每次检查会 stat 模块的全部文件
+PLAN_CHECK_INTERVAL = 1.0
 
 
 class GenerationResult:
@@ -24,7 +50,10 @@ class GenerationResult:
         files_count: int = 0,
         output_path: Optional[Path] = None,
         duration: float = 0.0,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        checksum: Optional[str] = None,
+        violation: Optional[Dict[str, Any]] = None,
+        memory: Optional[Dict[str, Any]] = None
     ):
         self.success = success
         self.project_id = project_id
@@ -33,6 +62,9 @@ class GenerationResult:
         self.output_path = output_path
         self.duration = duration
         self.error = error
+        self.checksum = checksum
+        self.violation = violation  # 超出的渲染预算
+        self.memory = memory  # 开启内存记账时的峰值/残留字节数
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -42,7 +74,10 @@ class GenerationResult:
             "files_count": self.files_count,
             "download_url": f"/api/generator/download/{self.project_id}" if self.success else None,
             "duration": round(self.duration, 2),
-            "error": self.error
+            "error": self.error,
+            "checksum": self.checksum,
+            "violation": self.violation,
+            "memory": self.memory
         }
 
 
@@ -50,63 +85,296 @@ class GeneratorEngine:
     """生成引擎"""
     
     def __init__(self):
+        # pydantic-settings 导入较慢，只在构建引擎时加载配置
+        from app.config import get_settings
+        
         self.settings = get_settings()
         self.settings.TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
         self.settings.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
         
-        self.template_loader = TemplateLoader(self.settings.TEMPLATES_DIR)
-        self._jinja_envs: Dict[str, Environment] = {}
+        self.store = create_artifact_store(self.settings)
+        self.template_loader = TemplateLoader(self.settings.TEMPLATES_DIR, self.settings.MAX_MODULES)
+        self.catalogue = Catalogue(self.template_loader)
+        # 每个模块一个 Jinja 环境，环境内已编译模板另有 TEMPLATE_CACHE_SIZE 上限
+        self._jinja_envs = BoundedCache("jinja_envs", self.settings.JINJA_ENV_CACHE_SIZE)
+        # 模块生成计划: (模块ID, 加载器版本) -> GenerationPlan
+        self._plans = BoundedCache("plans", self.settings.JINJA_ENV_CACHE_SIZE)
+        self.memory = get_memory_tracker()
+        self.budget = RenderBudget.from_settings(self.settings)
+        # 渲染线程池: 不阻塞事件循环，展开映射的多个文件并行写出
+        self._render_workers = min(8, (os.cpu_count() or 1) + 4)
+        self._render_pool = self._new_render_pool()
+        # 复制静态资源、打包与发布使用独立线程池，不受卡住的渲染线程影响
+        self._io_pool = ThreadPoolExecutor(max_workers=self._render_workers, thread_name_prefix="package")
+        # thread 模式下被看门狗放弃但仍在运行的渲染线程数
+        self._stuck_renders = 0
+        self._stuck_lock = threading.Lock()
+        # 进行中的生成: 配置指纹 -> 任务，相同请求合并为一次渲染
+        self._inflight: Dict[str, asyncio.Task] = {}
         
         logger.info(f"生成引擎初始化完成，共 {len(self.template_loader.get_all_modules())} 个模块")
     
-    def _get_jinja_env(self, module_path: Path) -> Environment:
+    def _new_render_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self._render_workers, thread_name_prefix="render")
+    
+    def _abandon_render_threads(self, pool: ThreadPoolExecutor, stuck: List[Future]):
+        """
+        看门狗放弃的渲染线程无法打断，也不会再归还线程池: 后续生成换用新的线程池，
+        旧线程池在这些线程结束后自行退出
+        """
+        with self._stuck_lock:
+            self._stuck_renders += len(stuck)
+            total = self._stuck_renders
+            if self._render_pool is pool:
+                self._render_pool = self._new_render_pool()
+                pool.shutdown(wait=False)
+        logger.warning(f"{len(stuck)} 个渲染线程未结束，后续渲染换用新的线程池 (共 {total} 个未结束)")
+        for future in stuck:
+            future.add_done_callback(self._render_thread_released)
+    
+    def _render_thread_released(self, _: Future):
+        with self._stuck_lock:
+            self._stuck_renders -= 1
+    
+    def _get_jinja_env(self, module_path: Path) -> "Environment":
         """获取Jinja2环境"""
-        key = str(module_path)
-        if key not in self._jinja_envs:
-            env = Environment(
-                loader=FileSystemLoader(str(module_path)),
-                trim_blocks=True,
-                lstrip_blocks=True,
-                keep_trailing_newline=True
+        return self._jinja_envs.get_or_create(
+            str(module_path),
+            lambda: create_jinja_env(module_path, self.settings.TEMPLATE_CACHE_SIZE)
+        )
+    
+    def _get_plan(self, module: ModuleDefinition) -> GenerationPlan:
+        """获取模块的生成计划，模块重新加载后重新编译"""
+        key = (module.id, self.template_loader.version)
+        
+        def compile_plan() -> GenerationPlan:
+            env = self._get_jinja_env(module.module_path)
+            return GenerationPlan(module, env, self.template_loader.version)
+        
+        plan = self._plans.get_or_create(key, compile_plan)
+        if self.settings.DEBUG:
+            now = time.monotonic()
+            if now - plan.checked_at >= PLAN_CHECK_INTERVAL:
+                plan.checked_at = now
+                if not plan.is_up_to_date():
+                    # 开发模式下模板文件被修改: 重新编译
+                    self._plans.pop(key)
+                    plan = self._plans.get_or_create(key, compile_plan)
+        return plan
+    
+    def prepare_plans(self):
+        """预先编译所有模块的生成计划，服务启动时调用"""
+        for module in self.template_loader.get_all_modules():
+            self._get_plan(module)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """引擎级缓存的条目数与上限"""
+        envs = self._jinja_envs.values()
+        return {
+            "jinja_envs": self._jinja_envs.stats(),
+            "plans": self._plans.stats(),
+            "compiled_templates": {
+                "entries": sum(len(env.cache) for env in envs if env.cache is not None),
+                "max_entries": self.settings.TEMPLATE_CACHE_SIZE * len(envs),
+                "per_env_limit": self.settings.TEMPLATE_CACHE_SIZE,
+            },
+            "modules": {
+                "entries": len(self.template_loader.get_all_modules()),
+                "max_entries": self.template_loader.max_modules,
+            },
+            "inflight_generations": len(self._inflight),
+            "stuck_render_threads": self._stuck_renders,
+        }
+    
+    def _render_job(self, template: "Template", context: Dict[str, Any], target_file: Path,
+                    source_path: str, target_path: str,
+                    tracker: BudgetTracker) -> Optional[Tuple[Path, str]]:
+        """渲染单个输出文件，返回 (文件, sha256)，失败返回 None；超出预算时记录到 tracker"""
+        try:
+            sha256 = render_with_budget(template, context, target_file, source_path, tracker)
+            logger.debug(f"  ✓ {source_path} -> {target_path}")
+            return target_file, sha256
+        except BudgetExceeded as e:
+            target_file.unlink(missing_ok=True)
+            tracker.fail(e)
+            return None
+        except Exception as e:
+            target_file.unlink(missing_ok=True)
+            logger.error(f"  ✗ 渲染失败 {source_path} -> {target_path}: {e}")
+            return None
+    
+    async def _render_in_threads(self, jobs: List[tuple]) -> List[Tuple[Path, str]]:
+        """
+        线程模式: 并行流式渲染，协作式检查预算
+        
+        Raises:
+            BudgetExceeded: 任一模板超出预算
+            RuntimeError: 未结束的渲染线程已达 RENDER_MAX_STUCK_THREADS，快速失败
+        """
+        limit = self.settings.RENDER_MAX_STUCK_THREADS
+        if limit and self._stuck_renders >= limit:
+            raise RuntimeError(
+                f"{self._stuck_renders} 个渲染线程被不结束的模板占用，暂停渲染；"
+                f"请检查模板或改用 RENDER_ISOLATION=process"
             )
-            # 自定义过滤器
-            env.filters["lower"] = str.lower
-            env.filters["upper"] = str.upper
-            self._jinja_envs[key] = env
-        return self._jinja_envs[key]
-    
-    def _render_path(self, path_template: str, context: Dict[str, Any]) -> str:
-        """渲染路径中的变量"""
-        # 处理 {{ variable }} 形式
-        def replace(match):
-            expr = match.group(1).strip()
-            # 简单变量
-            if expr in context:
-                return str(context[expr])
-            # 带过滤器 如 package_name | replace(".", "/")
-            if "|" in expr:
-                var, *filters = [p.strip() for p in expr.split("|")]
-                value = context.get(var, "")
-                for f in filters:
-                    if "replace" in f:
-                        # 提取 replace(".", "/")
-                        m = re.search(r'replace\(["\'](.+?)["\']\s*,\s*["\'](.+?)["\']\)', f)
-                        if m:
-                            value = value.replace(m.group(1), m.group(2))
-                return str(value)
-            return match.group(0)
-        
-        return re.sub(r'\{\{\s*(.+?)\s*\}\}', replace, path_template)
+        tracker = BudgetTracker(self.budget)
+        pool = self._render_pool
+        submitted = [pool.submit(self._render_job, *job, tracker) for job in jobs]
+        futures = [asyncio.wrap_future(f) for f in submitted]
+        # 看门狗: 不产生输出的模板不会触发协作检查，超时后直接让本次生成失败，
+        # 释放准入名额；其他渲染线程在下一次写出时因 tracker 已失败而停止
+        pending = set(futures)
+        while pending:
+            _, pending = await asyncio.wait(pending, timeout=RENDER_WATCHDOG_INTERVAL)
+            if pending and tracker.violation is None:
+                overdue = tracker.overdue(RENDER_WATCHDOG_GRACE)
+                if overdue is not None:
+                    tracker.fail(overdue)
+                    logger.warning(f"渲染线程未在预算内结束，放弃等待: {overdue}")
+            if pending and tracker.violation is not None:
+                # 尚未开始的任务不再执行，正在写出的任务稍后自行停止；宽限后仍在运行的视为卡住
+                for future in submitted:
+                    future.cancel()
+                await asyncio.wait(pending, timeout=RENDER_WATCHDOG_GRACE)
+                stuck = [f for f in submitted if not f.done()]
+                if stuck:
+                    self._abandon_render_threads(pool, stuck)
+                break
+        if tracker.violation is not None:
+            raise tracker.violation
+        return [f.result() for f in futures if f.result() is not None]
+    
+    async def _render_in_process(self, module_path: Path, jobs: List[tuple]) -> List[Tuple[Path, str]]:
+        """进程模式: 子进程渲染，超时可强制终止"""
+        isolated_jobs = [
+            (source_path, context, str(target_file), target_path)
+            for _, context, target_file, source_path, target_path in jobs
+        ]
+        loop = asyncio.get_running_loop()
+        errors, hashes = await loop.run_in_executor(
+            self._render_pool, render_isolated, module_path, isolated_jobs, self.budget
+        )
+        generated_files = []
+        for (_, _, target_file, source_path, target_path), error, sha256 in zip(jobs, errors, hashes):
+            if error is None:
+                logger.debug(f"  ✓ {source_path} -> {target_path}")
+                generated_files.append((target_file, sha256))
+            else:
+                logger.error(f"  ✗ 渲染失败 {source_path} -> {target_path}: {error}")
+        return generated_files
+    
+    def _copy_batch(self, batch: List[CopyJob]) -> List[Tuple[Path, str, str]]:
+        copied = []
+        for source_file, target_file, relpath, _ in batch:
+            try:
+                method = copy_static(source_file, target_file, hardlink=self.settings.STATIC_HARDLINK)
+                logger.debug(f"  ✓ {relpath} ({method})")
+                copied.append((target_file, relpath, method))
+            except OSError as e:
+                logger.error(f"  ✗ 复制失败 {relpath}: {e}")
+        return copied
+    
+    async def _copy_static(self, copies: List[CopyJob]) -> List[Tuple[Path, str, str]]:
+        """在 I/O 线程池中分批复制静态资源，返回 (目标文件, 相对路径, 复制方式) 列表"""
+        if not copies:
+            return []
+        loop = asyncio.get_running_loop()
+        batches = [copies[i:i + STATIC_COPY_BATCH] for i in range(0, len(copies), STATIC_COPY_BATCH)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._io_pool, self._copy_batch, batch)
+            for batch in batches
+        ))
+        return [f for batch in results for f in batch]
+    
+    def _config_key(self, module: ModuleDefinition, config: Dict[str, Any]) -> str:
+        """模块ID + 合并默认值后的规范化配置的指纹"""
+        effective = {f.name: f.default for f in module.fields if f.default is not None}
+        effective.update(config)
+        payload = json.dumps([module.id, effective], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
     
     async def generate(
         self,
         module_id: str,
         config: Dict[str, Any],
+        project_id: Optional[str] = None,
+        admission: Optional["Admission"] = None
+    ) -> GenerationResult:
+        """
+        生成项目
+        
+        未指定 project_id 时，并发到达的相同模块+相同配置+相同优先级请求只渲染一次，
+        共享同一个项目和 ZIP 包。
+        
+        Args:
+            admission: 调用方的准入凭据 (AdmissionController.ticket)。每个调用方都按
+                自己的客户端限流；只有实际执行生成的请求检查排队上限并占用名额，
+                合并到进行中生成的请求不占名额，排队截止时间以执行的请求为准。
+        
+        Raises:
+            AdmissionRejected: 本调用方被限流，或执行的请求排队失败
+        """
+        module = self.template_loader.get_module(module_id)
+        if project_id is not None or module is None:
+            if admission is not None:
+                admission.check()
+            return await self._generate_admitted(admission, module_id, config, project_id)
+        
+        # 在准入之前查找，排队中的相同请求也会被合并；只合并同一优先级类，
+        # 交互请求不会跟在批量请求后面排队
+        key = self._config_key(module, config)
+        if admission is not None:
+            key = f"{admission.priority}:{key}"
+        task = self._inflight.get(key)
+        if task is None:
+            if admission is not None:
+                admission.check()
+            task = asyncio.ensure_future(self._generate_admitted(admission, module_id, config))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            if admission is not None:
+                admission.check(queued=False)
+            logger.info(f"合并相同请求: module={module_id}, key={key[:24]}")
+        
+        # shield: 单个调用方断开不会取消共享的生成任务
+        return await asyncio.shield(task)
+    
+    async def _generate_admitted(
+        self,
+        admission: Optional["Admission"],
+        module_id: str,
+        config: Dict[str, Any],
         project_id: Optional[str] = None
     ) -> GenerationResult:
-        """生成项目"""
+        if admission is None:
+            return await self._generate(module_id, config, project_id)
+        async with admission.slot():
+            return await self._generate(module_id, config, project_id)
+    
+    async def _generate(
+        self,
+        module_id: str,
+        config: Dict[str, Any],
+        project_id: Optional[str] = None
+    ) -> GenerationResult:
+        """执行一次生成，开启内存记账时附带本次的内存用量"""
+        project_id = project_id or uuid.uuid4().hex
+        with self.memory.track(module_id, project_id) as usage:
+            result = await self._run(module_id, config, project_id)
+        if usage:
+            result.memory = usage
+        return result
+    
+    async def _run(
+        self,
+        module_id: str,
+        config: Dict[str, Any],
+        project_id: str
+    ) -> GenerationResult:
+        """渲染、打包并发布"""
         start_time = time.time()
-        project_id = project_id or str(uuid.uuid4())[:8]
+        staging_dir: Optional[Path] = None
         
         logger.info(f"开始生成: module={module_id}, project_id={project_id}")
         
@@ -123,45 +391,34 @@ class GeneratorEngine:
             # 2. 构建上下文
             context = self._build_context(module, config)
             
-            # 3. 创建输出目录
-            output_dir = self.settings.OUTPUT_DIR / project_id
-            if output_dir.exists():
-                shutil.rmtree(output_dir)
+            # 3. 在私有暂存目录中生成，完成前对外不可见
+            staging_dir = self.store.new_staging_dir(project_id)
+            output_dir = staging_dir / "project"
             output_dir.mkdir(parents=True)
             
-            # 4. 获取Jinja环境
-            env = self._get_jinja_env(module.module_path)
-            
-            # 5. 渲染所有文件
-            generated_files = []
+            # 4. 执行预编译的生成计划: 按序建目录、展开渲染任务
+            plan = self._get_plan(module)
+            jobs, copies = plan.build_jobs(context, output_dir)
             
-            for file_mapping in module.files:
-                source_path = file_mapping.source
-                target_path = self._render_path(file_mapping.target, context)
-                
-                source_file = module.module_path / source_path
-                target_file = output_dir / target_path
-                
-                if not source_file.exists():
-                    logger.warning(f"模板不存在: {source_path}")
-                    continue
-                
-                # 确保目标目录存在
-                target_file.parent.mkdir(parents=True, exist_ok=True)
-                
-                # 渲染模板
-                try:
-                    template = env.get_template(source_path)
-                    content = template.render(**context)
-                    target_file.write_text(content, encoding="utf-8")
-                    generated_files.append(target_file)
-                    logger.debug(f"  ✓ {source_path} -> {target_path}")
-                except Exception as e:
-                    logger.error(f"  ✗ 渲染失败 {source_path}: {e}")
+            # 5. 复制静态资源，在预算内流式渲染模板
+            copied = await self._copy_static(copies)
+            if self.settings.RENDER_ISOLATION == "process":
+                rendered = await self._render_in_process(module.module_path, jobs)
+            else:
+                rendered = await self._render_in_threads(jobs)
+            generated_files = [target_file for target_file, _ in rendered] + \
+                [target_file for target_file, _, _ in copied]
+            # 硬链接到模板目录的资源与模板文件共用 inode，不纳入内容寻址存储
+            linked = {relpath for _, relpath, method in copied if method == "link"}
             
-            # 6. 打包ZIP
-            zip_path = self.settings.OUTPUT_DIR / f"{project_id}.zip"
-            shutil.make_archive(str(zip_path.with_suffix("")), "zip", output_dir)
+            # 6-7. 登记文件指纹 (本地存储同时按内容去重)、打包ZIP并原子发布
+            #      静态资源的哈希在编译计划时已算好，模板输出在写出时已算好
+            known_hashes = self._known_hashes(output_dir, rendered, copies)
+            loop = asyncio.get_running_loop()
+            output_dir, checksum = await loop.run_in_executor(
+                self._io_pool, self._package, project_id, staging_dir, output_dir,
+                known_hashes, linked
+            )
             
             duration = time.time() - start_time
             logger.info(f"生成完成: {len(generated_files)} 个文件, 耗时 {duration:.2f}s")
@@ -172,9 +429,19 @@ class GeneratorEngine:
                 message=f"成功生成 {module.name}",
                 files_count=len(generated_files),
                 output_path=output_dir,
-                duration=duration
+                duration=duration,
+                checksum=checksum
             )
             
+        except BudgetExceeded as e:
+            logger.error(f"生成中止: {e}")
+            return GenerationResult(
+                success=False,
+                project_id=project_id,
+                error=str(e),
+                duration=time.time() - start_time,
+                violation=e.to_dict()
+            )
         except Exception as e:
             logger.error(f"生成失败: {e}")
             return GenerationResult(
@@ -183,6 +450,28 @@ class GeneratorEngine:
                 error=str(e),
                 duration=time.time() - start_time
             )
+        finally:
+            if staging_dir is not None:
+                self.store.discard(staging_dir)
+    
+    @staticmethod
+    def _known_hashes(output_dir: Path, rendered: List[Tuple[Path, str]],
+                      copies: List[CopyJob]) -> Dict[str, str]:
+        """相对路径 -> sha256 (计划保证每个文件只有一个任务写出)"""
+        hashes = {relpath: sha for _, _, relpath, sha in copies}
+        for target_file, sha256 in rendered:
+            hashes[target_file.relative_to(output_dir).as_posix()] = sha256
+        return hashes
+    
+    def _package(self, project_id: str, staging_dir: Path, output_dir: Path,
+                 known_hashes: Dict[str, str], linked: Set[str]) -> Tuple[Optional[Path], str]:
+        """登记、打包并发布 (阻塞 I/O，在 I/O 线程池中执行)"""
+        manifest = self.store.ingest(output_dir, known_hashes, linked)
+        staged_zip = staging_dir / "project.zip"
+        build_archive(output_dir, manifest, staged_zip)
+        checksum = file_sha256(staged_zip)
+        published = self.store.publish(project_id, output_dir, staged_zip, checksum, manifest)
+        return published, checksum
     
     def _build_context(self, module: ModuleDefinition, config: Dict[str, Any]) -> Dict[str, Any]:
         """构建渲染上下文"""
@@ -212,3 +501,9 @@ class GeneratorEngine:
     
     def get_module(self, module_id: str) -> Optional[ModuleDefinition]:
         return self.template_loader.get_module(module_id)
+
+
+@lru_cache()
+def get_engine() -> GeneratorEngine:
+    """获取引擎单例，各路由共享"""
+    return GeneratorEngine()
@@ -0,0 +1,216 @@
+"""
+内存观测 - 有界缓存与按次生成的内存记账
+
+- BoundedCache: 引擎级缓存统一使用的 LRU 容器，超出上限淘汰最久未用的条目
+- MemoryTracker: 可选的 tracemalloc 记账，记录每次生成的峰值与残留字节数，
+  按模块汇总，并可导出分配最多的代码行，用于在 OOM 之前发现泄漏
+
+tracemalloc 会拖慢 Python 代码的分配路径，默认关闭 (MEMORY_TRACKING)。
+"""
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Callable, Hashable
+import sys
+import threading
+import time
+import tracemalloc
+
+from app.utils.logger import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 保留最近多少次生成的记账明细
+RECENT_GENERATIONS = 50
+
+
+class BoundedCache:
+    """线程安全的 LRU 缓存，带命中与淘汰计数"""
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """命中则返回并标记为最近使用，否则调用 factory 创建并放入"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = factory()
+        with self._lock:
+            # 并发创建时保留先放入的
+            if key in self._data:
+                return self._data[key]
+            self._data[key] = value
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._data.values())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryTracker:
+    """
+    按次生成的内存记账
+
+    tracemalloc 是进程级的，并发生成时峰值取重叠窗口内的进程峰值，
+    会偏高；残留字节数为生成前后已跟踪内存之差，持续为正说明有泄漏。
+    process 渲染模式下子进程内的分配不计入。
+    """
+
+    def __init__(self, enabled: bool, frames: int = 1):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._active = 0
+        self._modules: Dict[str, Dict[str, Any]] = {}
+        self._recent: deque = deque(maxlen=RECENT_GENERATIONS)
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info(f"内存记账已开启 (tracemalloc, {frames} 帧)")
+
+    @contextmanager
+    def track(self, module_id: str, project_id: str):
+        """
+        记录一次生成，用法:
+
+            with tracker.track(module_id, project_id) as usage:
+                ...
+            usage["peak_bytes"], usage["retained_bytes"]
+
+        未开启时 usage 保持为空字典。
+        """
+        usage: Dict[str, Any] = {}
+        if not self.enabled or not tracemalloc.is_tracing():
+            yield usage
+            return
+
+        with self._lock:
+            if self._active == 0:
+                tracemalloc.reset_peak()
+            self._active += 1
+        before, _ = tracemalloc.get_traced_memory()
+        try:
+            yield usage
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                self._active -= 1
+            usage["peak_bytes"] = max(0, peak - before)
+            usage["retained_bytes"] = current - before
+            self._record(module_id, project_id, usage)
+
+    def _record(self, module_id: str, project_id: str, usage: Dict[str, Any]):
+        with self._lock:
+            stats = self._modules.setdefault(module_id, {
+                "generations": 0,
+                "max_peak_bytes": 0,
+                "total_peak_bytes": 0,
+                "total_retained_bytes": 0,
+            })
+            stats["generations"] += 1
+            stats["max_peak_bytes"] = max(stats["max_peak_bytes"], usage["peak_bytes"])
+            stats["total_peak_bytes"] += usage["peak_bytes"]
+            stats["total_retained_bytes"] += usage["retained_bytes"]
+            self._recent.append({
+                "module_id": module_id,
+                "project_id": project_id,
+                "at": time.time(),
+                **usage
+            })
+
+    def top_allocators(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """按代码行汇总当前仍存活的分配，未开启时返回空列表"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        return [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            modules = {
+                module_id: {
+                    **stats,
+                    "avg_peak_bytes": stats["total_peak_bytes"] // stats["generations"],
+                }
+                for module_id, stats in self._modules.items()
+            }
+            recent = list(self._recent)
+        traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+        return {
+            "enabled": self.enabled,
+            "traced_bytes": traced[0] if traced else None,
+            "traced_peak_bytes": traced[1] if traced else None,
+            "modules": modules,
+            "recent": recent,
+        }
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """进程常驻内存 (RSS)，取不到时为 None"""
+    rss = None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError, ValueError, IndexError):
+        pass
+    max_rss = None
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 单位为字节，Linux 为 KB
+        if sys.platform != "darwin":
+            max_rss *= 1024
+    return {"rss_bytes": rss, "max_rss_bytes": max_rss}
+
+
+@lru_cache()
+def get_memory_tracker() -> MemoryTracker:
+    """获取内存记账单例"""
+    from app.config import get_settings
+    
+    settings = get_settings()
+    return MemoryTracker(settings.MEMORY_TRACKING, settings.MEMORY_TRACKING_FRAMES)
@@ -0,0 +1,335 @@
+"""
+生成计划 - 每个模块预先编译一次，请求只执行计划
+
+编译时完成:
+- 校验模板源文件存在并编译为 Template 对象
+- 目标路径模板解析为字面量与表达式片段
+- 不含变量的目标路径预先校验，其目录去重后按层级排序
+- 目录模式 (module.directory) 下遍历整个目录: .j2 文件作为模板，其余作为
+  静态资源，预先计算哈希，请求时零拷贝复制且打包/登记时不再重新读取
+
+请求时只需渲染含变量的路径、按序创建目录，不再逐文件 stat 源模板、
+查找模板或重复 mkdir。
+"""
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple, TYPE_CHECKING
+import posixpath
+import re
+import time
+
+from app.core.storage import file_sha256
+from app.core.template_loader import ModuleDefinition, FileMapping
+from app.utils.logger import logger
+
+if TYPE_CHECKING:
+    from jinja2 import Environment, Template
+
+
+_VARIABLE = re.compile(r'\{\{\s*(.+?)\s*\}\}')
+_REPLACE = re.compile(r'replace\(["\'](.+?)["\']\s*,\s*["\'](.+?)["\']\)')
+
+
+def lookup(expr: str, context: Dict[str, Any]) -> Any:
+    """按点号路径取值，如 entity.class_name；不存在时返回 None"""
+    value: Any = context
+    for part in expr.split("."):
+        if isinstance(value, dict):
+            if part not in value:
+                return None
+            value = value[part]
+        else:
+            value = getattr(value, part, None)
+            if value is None:
+                return None
+    return value
+
+
+def safe_relpath(path: str) -> Optional[str]:
+    """
+    规范化目标相对路径，逃逸出输出目录时返回 None
+
+    输出目录是新建的暂存目录，其中没有符号链接，按字面规范化即可判断。
+    """
+    norm = posixpath.normpath(path.replace("\\", "/"))
+    if norm in (".", "..") or norm.startswith(("/", "../")) or re.match(r"^[A-Za-z]:", norm):
+        return None
+    return norm
+
+
+class _PathExpr:
+    """路径中的一个 {{ ... }} 表达式"""
+    __slots__ = ("text", "expr", "var", "replacements")
+
+    def __init__(self, text: str, expr: str):
+        self.text = text  # 原文，无法求值时保留
+        self.expr = expr
+        self.var: Optional[str] = None
+        self.replacements: List[Tuple[str, str]] = []
+        if "|" in expr:
+            # 带过滤器 如 package_name | replace(".", "/")
+            var, *filters = [p.strip() for p in expr.split("|")]
+            self.var = var
+            for f in filters:
+                if "replace" in f:
+                    m = _REPLACE.search(f)
+                    if m:
+                        self.replacements.append((m.group(1), m.group(2)))
+
+    def render(self, context: Dict[str, Any], strict: bool = False) -> str:
+        """
+        求值；strict 为 False 时无法求值的表达式保留原文
+
+        Raises:
+            ValueError: strict 为 True 且变量不存在
+        """
+        # 简单变量
+        if self.expr in context:
+            return str(context[self.expr])
+        if self.var is not None:
+            value = lookup(self.var, context)
+            if value is None and strict:
+                raise ValueError(f"目标路径中的变量无法求值: {self.text}")
+            value = "" if value is None else str(value)
+            for old, new in self.replacements:
+                value = value.replace(old, new)
+            return value
+        # 属性访问 如 entity.class_name
+        value = lookup(self.expr, context)
+        if value is not None:
+            return str(value)
+        if strict:
+            raise ValueError(f"目标路径中的变量无法求值: {self.text}")
+        return self.text
+
+
+class PathTemplate:
+    """预解析的目标路径模板"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[Any] = []
+        pos = 0
+        for m in _VARIABLE.finditer(source):
+            if m.start() > pos:
+                self._parts.append(source[pos:m.start()])
+            self._parts.append(_PathExpr(m.group(0), m.group(1).strip()))
+            pos = m.end()
+        if pos < len(source):
+            self._parts.append(source[pos:])
+        self.is_static = all(isinstance(p, str) for p in self._parts)
+
+    def render(self, context: Dict[str, Any], strict: bool = False) -> str:
+        if self.is_static:
+            return self.source
+        return "".join(p if isinstance(p, str) else p.render(context, strict) for p in self._parts)
+
+
+class PlanStep:
+    """一条文件映射的编译结果"""
+
+    def __init__(self, mapping: FileMapping, template: "Template"):
+        self.source = mapping.source
+        self.template = template
+        self.target = PathTemplate(mapping.target)
+        self.foreach = mapping.foreach
+        self.item = mapping.item
+        # 目标路径在编译期即可确定并校验
+        self.static_target: Optional[str] = None
+        if self.target.is_static and not self.foreach:
+            self.static_target = safe_relpath(self.target.source)
+
+    def contexts(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        展开文件映射
+
+        普通映射返回原上下文；带 foreach 的映射对列表中每个元素返回一个上下文，
+        元素以 item 为变量名注入，同时提供 _index 序号。
+        """
+        if not self.foreach:
+            return [context]
+
+        items = context.get(self.foreach)
+        if items is None:
+            return []
+        if not isinstance(items, list):
+            logger.warning(f"foreach 字段不是列表: {self.foreach}")
+            return []
+
+        return [
+            {**context, self.item: item, "_index": index}
+            for index, item in enumerate(items)
+        ]
+
+
+class StaticAsset:
+    """目录模式中原样复制的静态文件"""
+    __slots__ = ("source_file", "target", "static_target", "sha256", "mtime_ns")
+
+    def __init__(self, source_file: Path, target: str):
+        self.source_file = source_file
+        self.target = PathTemplate(target)
+        self.static_target = safe_relpath(target) if self.target.is_static else None
+        self.mtime_ns = source_file.stat().st_mtime_ns
+        self.sha256 = file_sha256(source_file)
+
+    def is_up_to_date(self) -> bool:
+        try:
+            return self.source_file.stat().st_mtime_ns == self.mtime_ns
+        except OSError:
+            return False
+
+
+# 静态资源复制任务: (源文件, 目标文件, 目标相对路径, sha256)
+CopyJob = Tuple[Path, Path, str, str]
+
+
+def _parents(relpath: str) -> List[str]:
+    """相对路径的所有上级目录，不含根"""
+    parents = []
+    parent = posixpath.dirname(relpath)
+    while parent:
+        parents.append(parent)
+        parent = posixpath.dirname(parent)
+    return parents
+
+
+class GenerationPlan:
+    """
+    模块的生成计划
+
+    Args:
+        module: 模块定义
+        env: 模块的 Jinja 环境
+        version: 编译时的模板加载器版本
+    """
+
+    def __init__(self, module: ModuleDefinition, env: "Environment", version: int = 0):
+        self.module_id = module.id
+        self.module_path = module.module_path
+        self.version = version
+        self.checked_at = time.monotonic()  # 上次检查模板是否修改的时间
+        self.steps: List[PlanStep] = []
+        self.assets: List[StaticAsset] = []
+        self.skipped: List[Dict[str, str]] = []
+
+        directories: Set[str] = set()
+        for mapping in module.files:
+            self._add_step(mapping, env, directories)
+        if module.directory:
+            self._add_directory(module.directory, env, directories)
+
+        # 按层级排序，父目录先于子目录创建，每个目录只 mkdir 一次
+        self.directories = sorted(directories, key=lambda d: (d.count("/"), d))
+
+    def _add_step(self, mapping: FileMapping, env: "Environment", directories: Set[str]):
+        if not (self.module_path / mapping.source).is_file():
+            self._skip(mapping.source, "模板不存在")
+            return
+        try:
+            template = env.get_template(mapping.source)
+        except Exception as e:
+            self._skip(mapping.source, f"模板编译失败: {e}")
+            return
+
+        step = PlanStep(mapping, template)
+        if step.target.is_static and not step.foreach:
+            if step.static_target is None:
+                self._skip(mapping.source, f"非法目标路径 {mapping.target}")
+                return
+            directories.update(_parents(step.static_target))
+        self.steps.append(step)
+
+    def _add_directory(self, directory: str, env: "Environment", directories: Set[str]):
+        """目录模式: .j2 文件去掉后缀渲染，其余文件原样复制，路径中可含变量"""
+        root = self.module_path / directory
+        if not root.is_dir():
+            self._skip(directory, "模板目录不存在")
+            return
+        for item in sorted(root.rglob("*")):
+            if not item.is_file():
+                continue
+            rel = item.relative_to(root).as_posix()
+            if rel.endswith(".j2"):
+                source = item.relative_to(self.module_path).as_posix()
+                self._add_step(FileMapping(source=source, target=rel[:-3]), env, directories)
+                continue
+
+            asset = StaticAsset(item, rel)
+            if asset.target.is_static:
+                if asset.static_target is None:
+                    self._skip(rel, "非法目标路径")
+                    continue
+                directories.update(_parents(asset.static_target))
+            self.assets.append(asset)
+
+    def _skip(self, source: str, reason: str):
+        logger.warning(f"{self.module_id}: 跳过 {source} ({reason})")
+        self.skipped.append({"source": source, "reason": reason})
+
+    def is_up_to_date(self) -> bool:
+        """模板与静态文件自编译后未被修改 (每个文件一次 stat，仅开发模式使用)"""
+        return all(step.template.is_up_to_date for step in self.steps) and \
+            all(asset.is_up_to_date() for asset in self.assets)
+
+    def build_jobs(self, context: Dict[str, Any], output_dir: Path) -> Tuple[List[tuple], List[CopyJob]]:
+        """
+        执行计划: 创建目录并展开渲染与复制任务
+
+        Returns:
+            渲染任务 (template, context, target_file, source_path, target_path) 列表,
+            静态资源复制任务列表
+
+        Raises:
+            ValueError: foreach 元素缺少路径中引用的属性，或多个任务写同一个文件
+                (如列表中有重复元素)
+        """
+        made: Set[str] = set(self.directories)
+        # 目标相对路径 -> 来源，并行写同一文件会得到交错的内容
+        targets: Dict[str, str] = {}
+
+        def claim(relpath: str, source: str):
+            if relpath in targets:
+                raise ValueError(f"{targets[relpath]} 与 {source} 生成同一个文件 {relpath}")
+            targets[relpath] = source
+        for directory in self.directories:
+            (output_dir / directory).mkdir()
+
+        def ensure_parents(relpath: str):
+            for parent in reversed(_parents(relpath)):
+                if parent not in made:
+                    (output_dir / parent).mkdir(exist_ok=True)
+                    made.add(parent)
+
+        jobs = []
+        for step in self.steps:
+            if step.static_target is not None:
+                claim(step.static_target, step.source)
+                jobs.append((step.template, context, output_dir / step.static_target,
+                             step.source, step.static_target))
+                continue
+
+            for item_context in step.contexts(context):
+                # 列表元素缺少属性时不能保留 {{ ... }} 原文，否则各元素落到同一路径
+                target_path = step.target.render(item_context, strict=bool(step.foreach))
+                # 列表元素来自用户输入，拒绝逃逸出输出目录的路径
+                relpath = safe_relpath(target_path)
+                if relpath is None:
+                    logger.warning(f"  ✗ 非法目标路径 {target_path}")
+                    continue
+                claim(relpath, f"{step.source}[{item_context['_index']}]" if step.foreach else step.source)
+                ensure_parents(relpath)
+                jobs.append((step.template, item_context, output_dir / relpath,
+                             step.source, target_path))
+
+        copies: List[CopyJob] = []
+        for asset in self.assets:
+            relpath = asset.static_target
+            if relpath is None:
+                relpath = safe_relpath(asset.target.render(context))
+                if relpath is None:
+                    logger.warning(f"  ✗ 非法目标路径 {asset.target.source}")
+                    continue
+                ensure_parents(relpath)
+            claim(relpath, asset.source_file.relative_to(self.module_path).as_posix())
+            copies.append((asset.source_file, output_dir / relpath, relpath, asset.sha256))
+        return jobs, copies
@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import Dict, Any, List
 from jinja2 import Environment, FileSystemLoader, select_autoescape, TemplateNotFound
 import re
+from app.core.storage import copy_static
 from app.utils.logger import logger
 
 
@@ -82,6 +83,31 @@ class TemplateRenderer:
             logger.error(f"渲染模板失败 {template_path}: {e}")
             raise
     
+    def render_to_file(
+        self,
+        template_path: Path,
+        context: Dict[str, Any],
+        module_path: Path,
+        output_path: Path,
+        buffer_size: int = 64 * 1024
+    ):
+        """
+        流式渲染模板到文件，内存占用受缓冲区大小限制
+        
+        Args:
+            template_path: 模板文件路径
+            context: 渲染上下文
+            module_path: 模块根目录
+            output_path: 输出文件路径
+            buffer_size: 写入缓冲区大小
+        """
+        env = self._get_env(module_path)
+        relative_path = template_path.relative_to(module_path)
+        template = env.get_template(relative_path.as_posix())
+        with open(output_path, "w", encoding="utf-8", buffering=buffer_size) as f:
+            for chunk in template.generate(**context):
+                f.write(chunk)
+    
     def render_directory(
         self,
         source_dir: Path,
@@ -122,16 +148,15 @@ class TemplateRenderer:
             if item.suffix == ".j2" or item.name.endswith(".j2"):
                 # 渲染模板
                 try:
-                    content = self.render_file(item, context, module_path)
-                    output_path.write_text(content, encoding="utf-8")
+                    self.render_to_file(item, context, module_path, output_path)
                     generated_files.append(output_path)
                     logger.debug(f"渲染: {rel_path} -> {output_rel_path}")
                 except Exception as e:
+                    output_path.unlink(missing_ok=True)
                     logger.error(f"渲染失败 {item}: {e}")
             else:
-                # 直接复制
-                import shutil
-                shutil.copy2(item, output_path)
+                # 直接复制，数据不经过 Python (reflink / sendfile)
+                copy_static(item, output_path)
                 generated_files.append(output_path)
                 logger.debug(f"复制: {rel_path}")
         
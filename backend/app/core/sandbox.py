@@ -0,0 +1,369 @@
+"""
+渲染沙箱 - 模板渲染的时间/输出/内存预算
+
+两种隔离方式:
+- thread (默认): 在线程池中渲染，每写出约 64K 字符检查一次耗时与输出量，超限即中止。
+  开销极低；不产生输出的死循环由引擎的看门狗按时判定失败并释放名额，
+  但该渲染线程无法被打断，引擎只能换用新的线程池并限制这类线程的总数。
+- process: 每次生成在独立子进程中渲染，超时直接杀掉子进程，并可用
+  RLIMIT_AS 限制内存。适合运行不受信任的模板。
+
+超出预算时抛出 BudgetExceeded，由引擎让本次生成失败并记录越界的模板。
+"""
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple, TYPE_CHECKING
+import hashlib
+import threading
+import time
+
+if TYPE_CHECKING:
+    # jinja2 在首次创建环境时才导入，缩短冷启动
+    from jinja2 import Environment, Template
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 流式渲染时攒够这么多字符才编码、计算哈希、写出并检查一次预算，
+# 单文件峰值内存与此相关而与文件大小无关
+RENDER_FLUSH_CHARS = 64 * 1024
+
+BUDGET_LABELS = {
+    "time": "渲染时间",
+    "output": "输出大小",
+    "memory": "内存",
+}
+
+
+class BudgetExceeded(Exception):
+    """渲染超出预算"""
+    def __init__(self, template: str, budget: str, limit: float, used: float):
+        self.template = template
+        self.budget = budget  # time / output / memory
+        self.limit = limit
+        self.used = used
+        super().__init__(
+            f"模板 {template} 超出{BUDGET_LABELS.get(budget, budget)}预算 "
+            f"(限制 {limit:g}, 实际 {used:g})"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "template": self.template,
+            "budget": self.budget,
+            "limit": self.limit,
+            "used": self.used,
+        }
+
+
+class RenderBudget:
+    """
+    渲染预算，0 表示不限制
+
+    Args:
+        template_seconds: 单个模板渲染时间
+        generation_seconds: 一次生成的总渲染时间
+        template_bytes: 单个输出文件大小
+        generation_bytes: 一次生成的总输出大小
+        memory_bytes: 渲染进程地址空间上限，仅 process 模式生效
+    """
+    def __init__(
+        self,
+        template_seconds: float = 0,
+        generation_seconds: float = 0,
+        template_bytes: int = 0,
+        generation_bytes: int = 0,
+        memory_bytes: int = 0
+    ):
+        self.template_seconds = template_seconds
+        self.generation_seconds = generation_seconds
+        self.template_bytes = template_bytes
+        self.generation_bytes = generation_bytes
+        self.memory_bytes = memory_bytes
+
+    @classmethod
+    def from_settings(cls, settings) -> "RenderBudget":
+        mb = 1024 * 1024
+        return cls(
+            template_seconds=settings.TEMPLATE_RENDER_TIMEOUT,
+            generation_seconds=settings.GENERATION_RENDER_TIMEOUT,
+            template_bytes=int(settings.TEMPLATE_MAX_OUTPUT_MB * mb),
+            generation_bytes=int(settings.GENERATION_MAX_OUTPUT_MB * mb),
+            memory_bytes=int(settings.RENDER_MEMORY_LIMIT_MB * mb)
+        )
+
+
+class BudgetTracker:
+    """一次生成内的预算计数，可被多个渲染线程共享"""
+    def __init__(self, budget: RenderBudget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.violation: Optional[BudgetExceeded] = None
+        # 正在渲染的任务 (输出文件) -> (模板, 开始时间)，供看门狗发现不产生输出的模板；
+        # foreach 展开的多个任务共用同一模板，必须按任务区分
+        self.active: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def fail(self, error: BudgetExceeded):
+        with self._lock:
+            if self.violation is None:
+                self.violation = error
+
+    def begin(self, job: str, template: str, started: float):
+        with self._lock:
+            self.active[job] = (template, started)
+
+    def end(self, job: str):
+        with self._lock:
+            self.active.pop(job, None)
+
+    def overdue(self, grace: float = 0.0) -> Optional[BudgetExceeded]:
+        """
+        看门狗检查: 超时仍未结束的模板 (包括一直不产生输出、不会触发 check 的模板)
+
+        Returns:
+            越界时返回对应的 BudgetExceeded，否则 None
+        """
+        budget = self.budget
+        now = time.monotonic()
+        with self._lock:
+            active = list(self.active.values())
+        if budget.template_seconds:
+            for template, started in active:
+                if now - started > budget.template_seconds + grace:
+                    return BudgetExceeded(template, "time", budget.template_seconds, round(now - started, 3))
+        if budget.generation_seconds and now - self.started > budget.generation_seconds + grace:
+            # 没有正在渲染的模板说明任务还在等待被占满的线程池
+            template = active[0][0] if active else "(等待渲染线程)"
+            return BudgetExceeded(template, "time", budget.generation_seconds, round(now - self.started, 3))
+        return None
+
+    def check(self, template: str, template_started: float, template_bytes: int, chunk_bytes: int):
+        """每写出一块调用一次，超限抛出 BudgetExceeded"""
+        budget = self.budget
+        if self.violation is not None:
+            # 其他文件已越界，尽快停止
+            raise self.violation
+
+        now = time.monotonic()
+        if budget.template_seconds and now - template_started > budget.template_seconds:
+            raise BudgetExceeded(template, "time", budget.template_seconds, round(now - template_started, 3))
+        if budget.generation_seconds and now - self.started > budget.generation_seconds:
+            raise BudgetExceeded(template, "time", budget.generation_seconds, round(now - self.started, 3))
+        if budget.template_bytes and template_bytes > budget.template_bytes:
+            raise BudgetExceeded(template, "output", budget.template_bytes, template_bytes)
+
+        with self._lock:
+            self.bytes += chunk_bytes
+            total = self.bytes
+        if budget.generation_bytes and total > budget.generation_bytes:
+            raise BudgetExceeded(template, "output", budget.generation_bytes, total)
+
+
+def create_jinja_env(module_path: Path, cache_size: int = 400) -> "Environment":
+    """
+    创建模块的Jinja2环境，cache_size 为已编译模板的 LRU 上限
+
+    过滤器、全局函数、公共模板目录 (templates/_common) 与自动转义规则同
+    TemplateRenderer，文件映射与目录模式的模板可使用相同的语法。
+    """
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    from app.core.renderer import TemplateRenderer
+    
+    env = Environment(
+        loader=FileSystemLoader([
+            str(module_path),
+            str(module_path.parent / "_common"),  # 公共模板
+        ]),
+        autoescape=select_autoescape(["html", "xml"]),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        keep_trailing_newline=True,
+        cache_size=cache_size
+    )
+    # 自定义过滤器
+    env.filters["lower"] = str.lower
+    env.filters["upper"] = str.upper
+    env.filters["camel_case"] = TemplateRenderer._to_camel_case
+    env.filters["pascal_case"] = TemplateRenderer._to_pascal_case
+    env.filters["snake_case"] = TemplateRenderer._to_snake_case
+    env.filters["kebab_case"] = TemplateRenderer._to_kebab_case
+    env.filters["package_path"] = lambda s: s.replace(".", "/")
+    # 全局函数
+    env.globals["now"] = TemplateRenderer._get_current_datetime
+    return env
+
+
+def render_with_budget(
+    template: "Template",
+    context: Dict[str, Any],
+    target_file: Path,
+    source_path: str,
+    tracker: BudgetTracker
+) -> str:
+    """
+    流式渲染并写入文件，边写边检查预算并计算内容哈希
+
+    Jinja 每段字面量/表达式产出一小块，逐块处理的开销远大于渲染本身；
+    这里按 RENDER_FLUSH_CHARS 攒批，每批编码、哈希、写出并检查一次预算。
+
+    Returns:
+        写出内容的 sha256，登记文件时不必再读回
+    """
+    started = time.monotonic()
+    written = 0
+    digest = hashlib.sha256()
+    job = str(target_file)
+    tracker.begin(job, source_path, started)
+    try:
+        with open(target_file, "wb") as f:
+            buffer: List[str] = []
+            buffered = 0
+            for chunk in template.generate(**context):
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if buffered < RENDER_FLUSH_CHARS:
+                    continue
+                data = "".join(buffer).encode("utf-8")
+                buffer.clear()
+                buffered = 0
+                written += len(data)
+                tracker.check(source_path, started, written, len(data))
+                f.write(data)
+                digest.update(data)
+            data = "".join(buffer).encode("utf-8")
+            written += len(data)
+            tracker.check(source_path, started, written, len(data))
+            f.write(data)
+            digest.update(data)
+    finally:
+        tracker.end(job)
+    return digest.hexdigest()
+
+
+# ==================== 进程隔离 ====================
+
+# 子进程任务: (源模板路径, 上下文, 输出文件, 目标相对路径)
+IsolatedJob = Tuple[str, Dict[str, Any], str, str]
+
+
+def _isolated_worker(conn, module_path: str, jobs: List[IsolatedJob], budget: RenderBudget):
+    """子进程入口: 顺序渲染并通过管道汇报进度"""
+    if budget.memory_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (budget.memory_bytes, budget.memory_bytes))
+
+    env = create_jinja_env(Path(module_path))
+    tracker = BudgetTracker(budget)
+    for index, (source_path, context, target_file, _) in enumerate(jobs):
+        conn.send(("start", index))
+        try:
+            template = env.get_template(source_path)
+            sha256 = render_with_budget(template, context, Path(target_file), source_path, tracker)
+            conn.send(("done", index, sha256))
+        except BudgetExceeded as e:
+            Path(target_file).unlink(missing_ok=True)
+            conn.send(("budget", index, e.budget, e.limit, e.used))
+            break
+        except MemoryError:
+            Path(target_file).unlink(missing_ok=True)
+            conn.send(("budget", index, "memory", budget.memory_bytes, budget.memory_bytes))
+            break
+        except Exception as e:
+            Path(target_file).unlink(missing_ok=True)
+            conn.send(("error", index, str(e)))
+    conn.send(("finished",))
+    conn.close()
+
+
+def _mp_context():
+    import multiprocessing
+    
+    # forkserver 从干净的服务进程派生，避免在多线程进程里直接 fork
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def render_isolated(
+    module_path: Path,
+    jobs: List[IsolatedJob],
+    budget: RenderBudget
+) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+    """
+    在子进程中渲染一次生成的全部文件，阻塞直到完成
+
+    超过单模板或整体时间预算时杀掉子进程。
+
+    Returns:
+        与 jobs 对应的 (错误信息列表, sha256 列表)，错误为 None 表示成功
+
+    Raises:
+        BudgetExceeded: 任一预算越界
+    """
+    ctx = _mp_context()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(
+        target=_isolated_worker,
+        args=(child_conn, str(module_path), jobs, budget),
+        daemon=True
+    )
+    started = time.monotonic()
+    process.start()
+    child_conn.close()
+
+    errors: List[Optional[str]] = ["未完成"] * len(jobs)
+    hashes: List[Optional[str]] = [None] * len(jobs)
+    current = -1
+    current_started = started
+    try:
+        while True:
+            now = time.monotonic()
+            deadlines = []
+            if budget.generation_seconds:
+                deadlines.append(started + budget.generation_seconds)
+            if budget.template_seconds and current >= 0:
+                deadlines.append(current_started + budget.template_seconds)
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+
+            if not parent_conn.poll(timeout):
+                # 超时: 杀掉子进程并归咎于当前模板
+                now = time.monotonic()
+                template = jobs[current][0] if current >= 0 else "-"
+                if budget.template_seconds and current >= 0 and \
+                        now - current_started >= budget.template_seconds:
+                    raise BudgetExceeded(template, "time", budget.template_seconds,
+                                         round(now - current_started, 3))
+                raise BudgetExceeded(template, "time", budget.generation_seconds,
+                                     round(now - started, 3))
+
+            try:
+                message = parent_conn.recv()
+            except EOFError:
+                # 子进程异常退出 (通常是超出内存限制被终止)
+                process.join()
+                template = jobs[current][0] if current >= 0 else "-"
+                if budget.memory_bytes:
+                    raise BudgetExceeded(template, "memory", budget.memory_bytes, budget.memory_bytes)
+                raise RuntimeError(f"渲染进程异常退出: exitcode={process.exitcode}")
+
+            kind = message[0]
+            if kind == "start":
+                current = message[1]
+                current_started = time.monotonic()
+            elif kind == "done":
+                errors[message[1]] = None
+                hashes[message[1]] = message[2]
+            elif kind == "error":
+                errors[message[1]] = message[2]
+            elif kind == "budget":
+                _, index, name, limit, used = message
+                raise BudgetExceeded(jobs[index][0], name, limit, used)
+            elif kind == "finished":
+                return errors, hashes
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        parent_conn.close()
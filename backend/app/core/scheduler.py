@@ -0,0 +1,180 @@
+"""
+公平调度器 - 生成名额在优先级类与客户端之间的分配
+
+- 优先级类: interactive (网页点击) / batch (批量生成) / background (预热、清理等)
+- 类之间按权重做加权公平排队，interactive 权重最高；另保留若干名额只给
+  interactive，批量任务占满其余名额时单次点击仍能立即开始
+- 同一类内按客户端轮转 (起始时间公平排队)，一个客户端的 500 个任务不会饿死其他客户端
+- 同一客户端内按截止时间先后执行，已过截止时间的请求不再调度
+"""
+from typing import Dict, Optional, List
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+
+PRIORITIES = ("interactive", "batch", "background")
+
+# 类权重: 各类都有积压时按此比例分配名额
+CLASS_WEIGHTS = {"interactive": 8, "batch": 2, "background": 1}
+
+
+class _Waiter:
+    __slots__ = ("future", "client", "priority", "deadline")
+
+    def __init__(self, future: asyncio.Future, client: str, priority: str, deadline: Optional[float]):
+        self.future = future
+        self.client = client
+        self.priority = priority
+        self.deadline = deadline  # time.monotonic() 时间点，None 为不限
+
+
+class _Flow:
+    """一个客户端在某优先级类中的等待队列"""
+    __slots__ = ("vtime", "heap")
+
+    def __init__(self, vtime: float):
+        self.vtime = vtime
+        self.heap: List[tuple] = []  # (截止时间, 序号, _Waiter)
+
+
+class FairScheduler:
+    """
+    生成名额调度器，用法:
+
+        await scheduler.acquire(client, "batch", deadline)
+        try:
+            ...
+        finally:
+            scheduler.release("batch")
+
+    Args:
+        capacity: 同时执行的名额数
+        reserved_interactive: 只给 interactive 使用的名额数
+    """
+
+    def __init__(self, capacity: int, reserved_interactive: int = 1):
+        self.capacity = capacity
+        self.reserved = max(0, min(reserved_interactive, capacity - 1))
+        self.in_use = 0
+        self.running = {p: 0 for p in PRIORITIES}
+        self.waiting = {p: 0 for p in PRIORITIES}
+        self._client_waiting: Dict[tuple, int] = {}  # (优先级, 客户端) -> 排队数
+
+        self._seq = itertools.count()
+        self._clock = 0.0  # 类之间的虚拟时钟
+        self._class_vtime = {p: 0.0 for p in PRIORITIES}
+        self._flows: Dict[str, Dict[str, _Flow]] = {p: {} for p in PRIORITIES}
+        self._flow_clock = {p: 0.0 for p in PRIORITIES}  # 类内客户端之间的虚拟时钟
+
+    async def acquire(self, client: str, priority: str, deadline: Optional[float] = None):
+        """
+        等待一个名额
+
+        Raises:
+            asyncio.TimeoutError: 到达截止时间仍未轮到
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._push(_Waiter(future, client, priority, deadline))
+        self._dispatch()
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 已分到名额但调用方超时/断开: 归还
+                self.release(priority)
+            else:
+                self.waiting[priority] -= 1
+                self._unqueue(priority, client)
+            raise
+
+    def release(self, priority: str):
+        """归还名额并调度下一个等待者"""
+        self.in_use -= 1
+        self.running[priority] -= 1
+        self._dispatch()
+
+    def _push(self, waiter: _Waiter):
+        p = waiter.priority
+        if self.waiting[p] == 0:
+            # 重新变为积压的类从当前虚拟时钟开始，空闲期间不积攒额度
+            self._class_vtime[p] = max(self._class_vtime[p], self._clock)
+        self.waiting[p] += 1
+        key = (p, waiter.client)
+        self._client_waiting[key] = self._client_waiting.get(key, 0) + 1
+
+        flows = self._flows[p]
+        flow = flows.get(waiter.client)
+        if flow is None:
+            flow = flows[waiter.client] = _Flow(self._flow_clock[p])
+        deadline = math.inf if waiter.deadline is None else waiter.deadline
+        heapq.heappush(flow.heap, (deadline, next(self._seq), waiter))
+
+    def _dispatch(self):
+        while self.in_use < self.capacity:
+            waiter = self._next(self.capacity - self.in_use)
+            if waiter is None:
+                return
+            p = waiter.priority
+            self.in_use += 1
+            self.running[p] += 1
+            self.waiting[p] -= 1
+            self._unqueue(p, waiter.client)
+            waiter.future.set_result(None)
+
+    def _next(self, free: int) -> Optional[_Waiter]:
+        """按类虚拟时间选类，再在类内选客户端"""
+        classes = [
+            p for p in PRIORITIES
+            if self.waiting[p] > 0 and (p == "interactive" or free > self.reserved)
+        ]
+        classes.sort(key=lambda p: (self._class_vtime[p], PRIORITIES.index(p)))
+        for p in classes:
+            waiter = self._pop(p)
+            if waiter is not None:
+                self._clock = self._class_vtime[p]
+                self._class_vtime[p] += 1.0 / CLASS_WEIGHTS[p]
+                return waiter
+        return None
+
+    def _pop(self, priority: str) -> Optional[_Waiter]:
+        flows = self._flows[priority]
+        now = time.monotonic()
+        while flows:
+            # 虚拟时间最小的客户端优先，相同时截止时间早的优先
+            client, flow = min(flows.items(), key=lambda kv: (kv[1].vtime, kv[1].heap[0][0]))
+            deadline, _, waiter = heapq.heappop(flow.heap)
+            if not flow.heap:
+                del flows[client]
+            if waiter.future.done():
+                # 已超时或调用方已断开
+                continue
+            if deadline <= now:
+                # 已过截止时间，执行也无意义
+                waiter.future.set_exception(asyncio.TimeoutError())
+                continue
+            self._flow_clock[priority] = flow.vtime
+            flow.vtime += 1.0
+            return waiter
+        return None
+
+    def _unqueue(self, priority: str, client: str):
+        key = (priority, client)
+        remaining = self._client_waiting[key] - 1
+        if remaining:
+            self._client_waiting[key] = remaining
+        else:
+            del self._client_waiting[key]
+            # 余下的都是已超时或已取消的等待者，类空闲时不会再被 _pop 清理
+            self._flows[priority].pop(client, None)
+
+    def waiting_for(self, priority: str, client: str) -> int:
+        """客户端在该类中排队 (尚未分到名额) 的请求数"""
+        return self._client_waiting.get((priority, client), 0)
+
+    def queued_clients(self, priority: str) -> int:
+        return len(self._flows[priority])
@@ -0,0 +1,772 @@
+"""
+产物存储 - 生成结果(项目目录 + ZIP)的发布与读取
+
+后端:
+- local: 本机 OUTPUT_DIR，每次发布一个版本目录并原子切换项目链接，
+  下载直接走 FileResponse(sendfile)，项目文件按内容硬链接到 .blobs 去重
+- shared: 多节点共享挂载目录，发布时加文件锁
+- sqlite: ZIP 与文件清单存入 SQLite，适合没有共享盘的多 worker 部署
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Set, Tuple, Iterator, BinaryIO, TYPE_CHECKING
+import asyncio
+import errno
+import io
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import sys
+import threading
+import time
+import uuid
+import zipfile
+
+from app.core.memory import BoundedCache
+from app.utils.logger import logger
+
+if TYPE_CHECKING:
+    import sqlite3
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+CHUNK_SIZE = 64 * 1024
+
+# 项目ID同时用作文件名，只允许这些字符 (引擎生成的是 32 位十六进制 uuid)
+PROJECT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# 引擎自动分配的项目ID (uuid4 十六进制)，只发布一次，不会被覆盖
+GENERATED_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# 本身已压缩的格式，打包时直接存储 (ZIP_STORED)，不再压缩
+STORED_SUFFIXES = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".woff", ".woff2", ".mp3", ".mp4", ".webm", ".pdf",
+    ".zip", ".jar", ".war", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar",
+})
+
+# Linux ioctl FICLONE: 在 btrfs/xfs 等文件系统上写时复制克隆文件
+FICLONE = 0x40049409
+
+# 去重 blob 被所有项目共享，去掉全部写权限
+READ_ONLY_MASK = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+_reflink_supported = sys.platform.startswith("linux") and fcntl is not None
+
+
+class ArchiveInfo:
+    """已发布的 ZIP 包"""
+    def __init__(
+        self,
+        project_id: str,
+        size: int,
+        sha256: Optional[str] = None,
+        path: Optional[Path] = None,
+        store: Optional["ArtifactStore"] = None
+    ):
+        self.project_id = project_id
+        self.size = size
+        self.sha256 = sha256  # 生成时预先计算的内容哈希
+        self.path = path  # 本地可直接 sendfile 时非空
+        self._store = store
+
+    def iter_chunks(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """按块读取 [start, end) 区间"""
+        end = self.size if end is None else end
+        if self.path is not None:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        else:
+            yield from self._store.read_archive(self.project_id, start, end)
+
+
+def is_valid_project_id(project_id: Any) -> bool:
+    """项目ID是否可以安全地用作 OUTPUT_DIR 下的文件名"""
+    return isinstance(project_id, str) and PROJECT_ID_PATTERN.fullmatch(project_id) is not None
+
+
+def is_generated_project_id(project_id: str) -> bool:
+    """是否为引擎自动分配的ID；指定ID (CLI --project-id / --id-field) 可被重新发布"""
+    return GENERATED_ID_PATTERN.fullmatch(project_id) is not None
+
+
+def check_project_id(project_id: str):
+    """
+    校验项目ID
+
+    Raises:
+        ValueError: 含路径分隔符、点号等非法字符或过长
+    """
+    if not is_valid_project_id(project_id):
+        raise ValueError(f"非法的项目ID: {project_id!r}")
+
+
+def file_sha256(path: Path) -> str:
+    """分块计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_tree(
+    project_dir: Path,
+    with_hash: bool = False,
+    known_hashes: Optional[Dict[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    扫描项目目录，生成文件清单
+
+    with_hash 为 True 时为每个文件附带 sha256，作为生成时记录的文件指纹；
+    known_hashes 中已有的 (相对路径 -> sha256) 不再重新读取计算。
+    """
+    files = []
+    for item in project_dir.rglob("*"):
+        rel_path = item.relative_to(project_dir)
+        is_file = item.is_file()
+        entry = {
+            "path": rel_path.as_posix(),
+            "name": item.name,
+            "type": "file" if is_file else "directory",
+            "size": item.stat().st_size if is_file else None
+        }
+        if with_hash:
+            if not is_file:
+                entry["sha256"] = None
+            elif known_hashes and entry["path"] in known_hashes:
+                entry["sha256"] = known_hashes[entry["path"]]
+            else:
+                entry["sha256"] = file_sha256(item)
+        files.append(entry)
+    return sorted(files, key=lambda x: (x["type"] == "file", x["path"]))
+
+
+def build_archive(project_dir: Path, manifest: List[Dict[str, Any]], zip_path: Path):
+    """
+    按文件清单打包 ZIP，已压缩格式直接存储
+
+    去重后的项目文件在存储中是只读的，ZIP 中恢复属主写权限，解压后可直接修改。
+    """
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for entry in manifest:
+            path = project_dir / entry["path"]
+            if entry["type"] == "directory":
+                zf.write(path, entry["path"])
+                continue
+            info = zipfile.ZipInfo.from_file(path, entry["path"])
+            info.external_attr |= stat.S_IWUSR << 16
+            stored = Path(entry["path"]).suffix.lower() in STORED_SUFFIXES
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with open(path, "rb") as src, zf.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """尝试写时复制克隆，不支持时返回 False 且之后不再尝试"""
+    global _reflink_supported
+    if not _reflink_supported:
+        return False
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS):
+                _reflink_supported = False
+            return False
+
+
+def copy_static(src: Path, dst: Path, hardlink: bool = False) -> str:
+    """
+    复制静态文件，数据不经过 Python
+
+    依次尝试: 硬链接 (hardlink=True 时) -> reflink -> shutil.copyfile
+    (Linux 上走 sendfile，macOS 上走 fcopyfile)。
+
+    Returns:
+        实际使用的方式: link / reflink / copy
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+def run_in_background(fn):
+    """
+    后台执行清理类任务
+
+    在事件循环线程中提交到默认线程池；在工作线程 (如引擎的打包步骤) 或
+    CLI 中另起线程，不拖慢当前生成。
+    """
+    try:
+        asyncio.get_running_loop().run_in_executor(None, fn)
+    except RuntimeError:
+        threading.Thread(target=fn, name="storage-cleanup").start()
+
+
+def remove_later(path: Path, trash_root: Path):
+    """移入回收区并在线程池中删除，不阻塞请求"""
+    if path.exists():
+        try:
+            os.rename(path, trash_root / f"{path.name}-{uuid.uuid4().hex}")
+        except OSError:
+            pass
+
+    def purge():
+        for item in trash_root.iterdir():
+            shutil.rmtree(item, ignore_errors=True)
+
+    run_in_background(purge)
+
+
+class ArtifactStore(ABC):
+    """产物存储接口"""
+
+    def __init__(self, staging_root: Path):
+        # 暂存目录需与发布位置同盘，rename 才是原子的
+        self.staging_root = staging_root
+        self.trash_root = staging_root.parent / ".trash"
+        self.staging_root.mkdir(parents=True, exist_ok=True)
+        self.trash_root.mkdir(parents=True, exist_ok=True)
+
+    def new_staging_dir(self, project_id: str) -> Path:
+        """分配私有暂存目录"""
+        check_project_id(project_id)
+        staging_dir = self.staging_root / f"{project_id}-{uuid.uuid4().hex}"
+        staging_dir.mkdir(parents=True)
+        return staging_dir
+
+    def discard(self, path: Path):
+        """丢弃暂存目录"""
+        remove_later(path, self.trash_root)
+
+    def ingest(
+        self,
+        staged_dir: Path,
+        known_hashes: Optional[Dict[str, str]] = None,
+        external: Optional[Set[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        登记暂存目录中的文件，返回带 sha256 的文件清单
+
+        支持内容寻址的后端在此对文件去重。known_hashes 为已知哈希的文件
+        (如预先计算过的静态资源)，不再重新读取；external 为与外部文件共享
+        inode 的文件 (硬链接到模板目录的静态资源)，外部文件可能被原地修改，
+        不能纳入内容寻址存储。
+        """
+        return scan_tree(staged_dir, with_hash=True, known_hashes=known_hashes)
+
+    @abstractmethod
+    def publish(
+        self,
+        project_id: str,
+        staged_dir: Path,
+        staged_zip: Path,
+        sha256: str,
+        manifest: List[Dict[str, Any]]
+    ) -> Optional[Path]:
+        """
+        发布生成结果
+
+        Args:
+            sha256: ZIP 的内容哈希
+            manifest: ingest 返回的文件清单
+
+        Returns:
+            项目目录在本机的路径，非文件系统后端返回 None
+        """
+
+    @abstractmethod
+    def get_archive(self, project_id: str) -> Optional[ArchiveInfo]:
+        """获取 ZIP 包，不存在返回 None"""
+
+    @abstractmethod
+    def list_files(self, project_id: str) -> Optional[List[Dict[str, Any]]]:
+        """获取项目文件清单，不存在返回 None"""
+
+    @abstractmethod
+    def open_file(self, project_id: str, path: str) -> BinaryIO:
+        """
+        以二进制只读方式打开项目中的单个文件
+
+        Raises:
+            FileNotFoundError: 项目或文件不存在
+        """
+
+    def read_archive(self, project_id: str, start: int, end: int) -> Iterator[bytes]:
+        """
+        读取 ZIP 的 [start, end) 字节区间
+
+        默认从 get_archive 返回的本地路径读取，ZIP 不在本机文件系统的后端需覆盖。
+
+        Raises:
+            FileNotFoundError: 项目不存在或 ZIP 没有本地路径
+        """
+        archive = self.get_archive(project_id)
+        if archive is None or archive.path is None:
+            raise FileNotFoundError(project_id)
+        yield from archive.iter_chunks(start, end)
+
+
+class LocalArtifactStore(ArtifactStore):
+    """
+    本机文件系统存储
+
+    每次发布是 .releases 下的一个版本目录 (project/ 项目文件、project.zip、
+    project.zip.sha256、manifest.json)，OUTPUT_DIR/<项目ID> 是指向当前版本的
+    符号链接。发布时整体切换链接，读取时先解析链接再从同一版本目录读取，
+    ZIP、哈希与清单不会来自不同的版本。
+
+    生成的文件按内容去重: 每个文件以 sha256 为名存入 .blobs 目录，
+    项目目录中的同内容文件都是指向它的硬链接。大量项目共享相同的
+    样板文件时只占一份磁盘空间和页缓存。
+    """
+
+    # 清理无引用 blob 与旧版本的最小间隔 (秒)
+    BLOB_GC_INTERVAL = 600
+    # 被替换的版本保留的时间 (秒)，已解析到旧版本的下载仍可完成
+    RELEASE_GRACE = 60
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.blob_root = root / ".blobs"
+        self.blob_root.mkdir(exist_ok=True)
+        self.release_root = root / ".releases"
+        self.release_root.mkdir(exist_ok=True)
+        self._last_gc = 0.0
+        # sha256 -> 登记时的 (大小, 修改时间)，复用 blob 前核对
+        self._verified_blobs = BoundedCache("verified_blobs", 20000)
+        super().__init__(root / ".staging")
+
+    def _release_dir(self, project_id: str) -> Optional[Path]:
+        """解析项目链接，返回当前发布的版本目录；不存在返回 None"""
+        if not is_valid_project_id(project_id):
+            return None
+        try:
+            return self.root / os.readlink(self.root / project_id)
+        except OSError:
+            return None
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self.blob_root / sha256[:2] / sha256
+
+    def _link_blob(self, file_path: Path, sha256: str):
+        """
+        把文件换成指向同内容 blob 的硬链接，blob 不存在时以该文件为 blob
+
+        同一 inode 被所有项目共享，因此 blob 去掉写权限；复用前核对大小与修改时间
+        (首次见到的 blob 校验一次内容)，被改动过的 blob 不再复用，以新文件取代。
+        """
+        blob = self._blob_path(sha256)
+        try:
+            try:
+                blob_stat = blob.stat()
+            except FileNotFoundError:
+                blob_stat = None
+            if blob_stat is not None:
+                if os.path.samestat(blob_stat, file_path.stat()):
+                    return
+                if self._blob_intact(blob, sha256, blob_stat):
+                    tmp = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}")
+                    os.link(blob, tmp)
+                    os.replace(tmp, file_path)
+                    return
+                # 之前链接到它的项目保留改动后的内容，新项目使用新的 blob
+                logger.warning(f"内容寻址文件已被修改，不再复用: {blob}")
+                blob.unlink(missing_ok=True)
+            blob.parent.mkdir(exist_ok=True)
+            try:
+                os.link(file_path, blob)
+            except FileExistsError:
+                # 并发生成刚写入了同一 blob
+                self._link_blob(file_path, sha256)
+                return
+            mode = stat.S_IMODE(file_path.stat().st_mode)
+            os.chmod(blob, mode & ~READ_ONLY_MASK)
+            blob_stat = blob.stat()
+            self._verified_blobs.pop(sha256)
+            self._verified_blobs.get_or_create(sha256, lambda: (blob_stat.st_size, blob_stat.st_mtime_ns))
+        except OSError as e:
+            # 文件系统不支持硬链接时保留独立副本
+            logger.debug(f"文件去重跳过 {file_path}: {e}")
+
+    def _blob_intact(self, blob: Path, sha256: str, blob_stat: os.stat_result) -> bool:
+        """blob 未被改动: 只读，且大小与修改时间与登记时一致"""
+        if blob_stat.st_mode & READ_ONLY_MASK:
+            return False
+        signature = self._verified_blobs.get_or_create(sha256, lambda: self._blob_signature(blob, sha256))
+        if signature == (blob_stat.st_size, blob_stat.st_mtime_ns):
+            return True
+        self._verified_blobs.pop(sha256)
+        return False
+
+    @staticmethod
+    def _blob_signature(blob: Path, sha256: str) -> Optional[Tuple[int, int]]:
+        """其他进程或之前运行写入的 blob: 校验一次内容，返回 (大小, 修改时间)"""
+        blob_stat = blob.stat()
+        if file_sha256(blob) != sha256:
+            return None
+        return blob_stat.st_size, blob_stat.st_mtime_ns
+
+    def ingest(
+        self,
+        staged_dir: Path,
+        known_hashes: Optional[Dict[str, str]] = None,
+        external: Optional[Set[str]] = None
+    ) -> List[Dict[str, Any]]:
+        manifest = scan_tree(staged_dir, with_hash=True, known_hashes=known_hashes)
+        for entry in manifest:
+            if entry["type"] == "file" and not (external and entry["path"] in external):
+                self._link_blob(staged_dir / entry["path"], entry["sha256"])
+        self._maybe_gc()
+        return manifest
+
+    def _maybe_gc(self):
+        """
+        定期清理: 被替换超过 RELEASE_GRACE 秒的旧版本，以及只剩 blob 自身
+        一个链接的文件 (所有项目都已删除)
+        """
+        now = time.monotonic()
+        if now - self._last_gc < self.BLOB_GC_INTERVAL:
+            return
+        self._last_gc = now
+
+        def collect():
+            current = set()
+            for link in self.root.iterdir():
+                if link.is_symlink():
+                    current.add(Path(os.readlink(link)).name)
+            expired = time.time() - self.RELEASE_GRACE
+            for release in self.release_root.iterdir():
+                try:
+                    if release.name not in current and release.stat().st_mtime < expired:
+                        remove_later(release, self.trash_root)
+                except OSError:
+                    pass
+
+            removed = 0
+            for blob in self.blob_root.glob("*/*"):
+                try:
+                    if blob.stat().st_nlink == 1:
+                        blob.unlink()
+                        removed += 1
+                except OSError:
+                    pass
+            if removed:
+                logger.info(f"清理无引用文件 {removed} 个")
+
+        run_in_background(collect)
+
+    def publish(
+        self,
+        project_id: str,
+        staged_dir: Path,
+        staged_zip: Path,
+        sha256: str,
+        manifest: List[Dict[str, Any]]
+    ) -> Optional[Path]:
+        """
+        项目文件、ZIP、哈希与清单先移入新的版本目录，再用一次 os.replace
+        把项目链接切换到该目录: 读取方要么看到完整的旧版本，要么看到完整的新版本。
+        旧版本目录保留 RELEASE_GRACE 秒后由定期清理删除。
+        """
+        check_project_id(project_id)
+        release_name = f"{project_id}-{uuid.uuid4().hex}"
+        release = self.release_root / release_name
+        release.mkdir()
+        os.rename(staged_dir, release / "project")
+        os.rename(staged_zip, release / "project.zip")
+        (release / "project.zip.sha256").write_text(sha256, encoding="utf-8")
+        (release / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+
+        link = self.root / project_id
+        tmp_link = self.staging_root / f"{release_name}.link"
+        os.symlink(f"{self.release_root.name}/{release_name}", tmp_link)
+        previous = self._release_dir(project_id)
+        try:
+            os.replace(tmp_link, link)
+        except IsADirectoryError:
+            # 旧版本直接发布的项目目录: 移入回收区后重试
+            remove_later(link, self.trash_root)
+            os.replace(tmp_link, link)
+        if previous is not None:
+            # 标记被替换的时间，定期清理按此判断保留期
+            try:
+                os.utime(previous)
+            except OSError:
+                pass
+        return link / "project"
+
+    def get_archive(self, project_id: str) -> Optional[ArchiveInfo]:
+        release = self._release_dir(project_id)
+        if release is None:
+            return None
+        zip_path = release / "project.zip"
+        try:
+            size = zip_path.stat().st_size
+            sha256 = (release / "project.zip.sha256").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        return ArchiveInfo(project_id, size, sha256=sha256, path=zip_path)
+
+    def list_files(self, project_id: str) -> Optional[List[Dict[str, Any]]]:
+        release = self._release_dir(project_id)
+        if release is None:
+            return None
+        try:
+            with open(release / "manifest.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def open_file(self, project_id: str, path: str) -> BinaryIO:
+        release = self._release_dir(project_id)
+        if release is None:
+            raise FileNotFoundError(project_id)
+        return open(release / "project" / path, "rb")
+
+
+class SharedDirArtifactStore(LocalArtifactStore):
+    """
+    共享挂载目录存储 (NFS/SMB 等)
+
+    多个节点可能同时发布同一ID，发布过程用每个项目一把的文件锁串行化。
+    """
+
+    def __init__(self, root: Path):
+        super().__init__(root)
+        self.lock_root = root / ".locks"
+        self.lock_root.mkdir(exist_ok=True)
+
+    @contextmanager
+    def _lock(self, project_id: str):
+        with open(self.lock_root / f"{project_id}.lock", "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def publish(
+        self,
+        project_id: str,
+        staged_dir: Path,
+        staged_zip: Path,
+        sha256: str,
+        manifest: List[Dict[str, Any]]
+    ) -> Optional[Path]:
+        check_project_id(project_id)
+        with self._lock(project_id):
+            return super().publish(project_id, staged_dir, staged_zip, sha256, manifest)
+
+
+class _BlobFile(io.RawIOBase):
+    """把 sqlite3.Blob 包装成 zipfile 可用的可寻址文件对象"""
+    def __init__(self, blob):
+        self._blob = blob
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def tell(self) -> int:
+        return self._blob.tell()
+
+    def readinto(self, buffer) -> int:
+        data = self._blob.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class SqliteArtifactStore(ArtifactStore):
+    """SQLite 二进制存储，ZIP 以 BLOB 保存，文件清单以 JSON 保存"""
+
+    def __init__(self, db_path: Path, staging_root: Path):
+        super().__init__(staging_root)
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                " project_id TEXT PRIMARY KEY,"
+                " archive BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " files TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> "sqlite3.Connection":
+        # 每次操作独立连接，可在线程池中安全使用；流式下载时同一连接会被
+        # 线程池中的不同线程依次使用 (不会并发)，因此关闭同线程检查
+        import sqlite3
+        
+        return sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+
+    def publish(
+        self,
+        project_id: str,
+        staged_dir: Path,
+        staged_zip: Path,
+        sha256: str,
+        manifest: List[Dict[str, Any]]
+    ) -> Optional[Path]:
+        check_project_id(project_id)
+        files = json.dumps(manifest, ensure_ascii=False)
+        size = staged_zip.stat().st_size
+
+        conn = self._connect()
+        try:
+            with conn:
+                if hasattr(conn, "blobopen"):
+                    # 分块写入，避免整包读入内存
+                    cur = conn.execute(
+                        "INSERT OR REPLACE INTO artifacts VALUES (?, zeroblob(?), ?, ?, ?, ?)",
+                        (project_id, size, size, sha256, files, time.time())
+                    )
+                    with conn.blobopen("artifacts", "archive", cur.lastrowid) as blob, \
+                            open(staged_zip, "rb") as f:
+                        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                            blob.write(chunk)
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                        (project_id, staged_zip.read_bytes(), size, sha256, files, time.time())
+                    )
+        finally:
+            conn.close()
+        return None
+
+    def get_archive(self, project_id: str) -> Optional[ArchiveInfo]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT size, sha256 FROM artifacts WHERE project_id = ?", (project_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return ArchiveInfo(project_id, row[0], sha256=row[1], store=self)
+
+    def read_archive(self, project_id: str, start: int, end: int) -> Iterator[bytes]:
+        conn = self._connect()
+        try:
+            if hasattr(conn, "blobopen"):
+                # 增量读取 BLOB；substr() 每次调用都会加载整个 BLOB
+                row = conn.execute(
+                    "SELECT rowid FROM artifacts WHERE project_id = ?", (project_id,)
+                ).fetchone()
+                if row is None:
+                    return
+                with conn.blobopen("artifacts", "archive", row[0], readonly=True) as blob:
+                    blob.seek(start)
+                    offset = start
+                    while offset < end:
+                        data = blob.read(min(CHUNK_SIZE, end - offset))
+                        if not data:
+                            break
+                        offset += len(data)
+                        yield data
+                return
+
+            offset = start
+            while offset < end:
+                length = min(CHUNK_SIZE, end - offset)
+                row = conn.execute(
+                    "SELECT substr(archive, ?, ?) FROM artifacts WHERE project_id = ?",
+                    (offset + 1, length, project_id)
+                ).fetchone()
+                if row is None or not row[0]:
+                    break
+                offset += len(row[0])
+                yield row[0]
+        finally:
+            conn.close()
+
+    def list_files(self, project_id: str) -> Optional[List[Dict[str, Any]]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT files FROM artifacts WHERE project_id = ?", (project_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def open_file(self, project_id: str, path: str) -> BinaryIO:
+        """从库中的 ZIP 解出单个文件，BLOB 按需随机读取"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT rowid FROM artifacts WHERE project_id = ?", (project_id,)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(project_id)
+            if hasattr(conn, "blobopen"):
+                with conn.blobopen("artifacts", "archive", row[0], readonly=True) as blob:
+                    with zipfile.ZipFile(_BlobFile(blob)) as zf:
+                        data = zf.read(path)
+            else:
+                archive = conn.execute(
+                    "SELECT archive FROM artifacts WHERE rowid = ?", (row[0],)
+                ).fetchone()[0]
+                with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+                    data = zf.read(path)
+        except KeyError:
+            raise FileNotFoundError(path)
+        finally:
+            conn.close()
+        return io.BytesIO(data)
+
+
+def create_artifact_store(settings) -> ArtifactStore:
+    """根据配置创建产物存储"""
+    backend = settings.ARTIFACT_STORE.lower()
+    if backend == "local":
+        return LocalArtifactStore(settings.OUTPUT_DIR)
+    if backend == "shared":
+        return SharedDirArtifactStore(settings.ARTIFACT_SHARED_DIR or settings.OUTPUT_DIR)
+    if backend == "sqlite":
+        return SqliteArtifactStore(settings.ARTIFACT_DB_PATH, settings.OUTPUT_DIR / ".staging")
+    logger.warning(f"未知的产物存储类型: {settings.ARTIFACT_STORE}，使用 local")
+    return LocalArtifactStore(settings.OUTPUT_DIR)
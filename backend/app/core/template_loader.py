@@ -3,7 +3,6 @@
 """
 from pathlib import Path
 from typing import Dict, Any, List, Optional
-import yaml
 from pydantic import BaseModel, Field
 from app.utils.logger import logger
 
@@ -24,6 +23,8 @@ class FileMapping(BaseModel):
     """文件映射"""
     source: str  # 源模板路径
     target: str  # 目标路径（支持变量）
+    foreach: Optional[str] = None  # 列表字段名，每个元素生成一个文件
+    item: str = "item"  # foreach 时当前元素的变量名
 
 
 class ModuleDefinition(BaseModel):
@@ -38,6 +39,7 @@ class ModuleDefinition(BaseModel):
     tech_stack: List[str] = []
     fields: List[FieldDefinition] = []
     files: List[FileMapping] = []  # 文件映射列表
+    directory: Optional[str] = None  # 目录模式: 整个子目录生成到项目根 (.j2 渲染，其余原样复制)
     module_path: Optional[Path] = None
     
     class Config:
@@ -47,13 +49,16 @@ class ModuleDefinition(BaseModel):
 class TemplateLoader:
     """模板加载器"""
     
-    def __init__(self, templates_dir: Path):
+    def __init__(self, templates_dir: Path, max_modules: int = 500):
         self.templates_dir = templates_dir
+        self.max_modules = max_modules
         self._modules: Dict[str, ModuleDefinition] = {}
+        self.version = 0  # 每次(重新)加载递增，供目录缓存判断失效
         self._load_all_modules()
     
     def _load_all_modules(self):
         """加载所有模块"""
+        self.version += 1
         if not self.templates_dir.exists():
             logger.warning(f"模板目录不存在: {self.templates_dir}")
             return
@@ -69,6 +74,10 @@ class TemplateLoader:
                 logger.warning(f"模块缺少配置: {module_dir.name}")
                 continue
             
+            if len(self._modules) >= self.max_modules:
+                logger.warning(f"模块数已达上限 {self.max_modules}，跳过: {module_dir.name}")
+                continue
+            
             try:
                 module = self._load_module(module_yaml, module_dir)
                 self._modules[module.id] = module
@@ -78,6 +87,8 @@ class TemplateLoader:
     
     def _load_module(self, yaml_path: Path, module_dir: Path) -> ModuleDefinition:
         """从YAML加载模块"""
+        import yaml
+        
         with open(yaml_path, "r", encoding="utf-8") as f:
             data = yaml.safe_load(f)
         
@@ -90,7 +101,17 @@ class TemplateLoader:
             data["files"] = [FileMapping(**f) for f in data["files"]]
         
         data["module_path"] = module_dir
-        return ModuleDefinition(**data)
+        module = ModuleDefinition(**data)
+        
+        if module.directory and not (module_dir / module.directory).is_dir():
+            logger.warning(f"{module.id}: 模板目录不存在 {module.directory}")
+        
+        field_names = {f.name for f in module.fields}
+        for mapping in module.files:
+            if mapping.foreach and mapping.foreach not in field_names:
+                logger.warning(f"{module.id}: foreach 引用了未定义的字段 {mapping.foreach} ({mapping.source})")
+        
+        return module
     
     def get_all_modules(self) -> List[ModuleDefinition]:
         return list(self._modules.values())
@@ -2,13 +2,16 @@
 中国学生作业代码生成器 - FastAPI 后端主入口
 v2.0 - 生产级架构重构
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
 from app.api import generator, modules, templates, internal
 from app.config import get_settings, init_directories
+from app.core.admission import AdmissionRejected
+from app.core.engine import get_engine
 from app.utils.logger import logger
 
 
@@ -20,6 +23,8 @@ async def lifespan(app: FastAPI):
     logger.info("中国学生作业代码生成器 v2.0 启动中...")
     init_directories()
     logger.info("目录初始化完成")
+    # 导入时不构建引擎，在接收请求前预热并编译生成计划，避免首个请求承担加载耗时
+    get_engine().prepare_plans()
     logger.info("=" * 50)
     
     yield
@@ -46,15 +51,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """限流/过载时快速失败，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # 注册API路由
 app.include_router(generator.router, prefix="/api/generator", tags=["生成器"])
 app.include_router(modules.router, prefix="/api/modules", tags=["模块管理"])
 app.include_router(templates.router, prefix="/api/templates", tags=["模板管理"])
 app.include_router(internal.router, prefix="/api/internal", tags=["内部测试"])
 
-# 静态文件服务
-settings.OUTPUT_DIR.mkdir(exist_ok=True)
-app.mount("/output", StaticFiles(directory=str(settings.OUTPUT_DIR)), name="output")
+# 静态文件服务 (目录在启动时由 init_directories 创建)
+app.mount("/output", StaticFiles(directory=str(settings.OUTPUT_DIR), check_dir=False), name="output")
 
 
 @app.get("/")
@@ -0,0 +1,24 @@
+"""
+HTTP 缓存工具 - 预序列化响应与 ETag 条件请求
+"""
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match / If-Range 比较，忽略弱校验前缀"""
+    if header.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in header.split(","))
+
+
+def cached_json_response(request: Request, cached, max_age: int = 60) -> Response:
+    """返回预序列化的 JSON (带 body/etag 属性)，If-None-Match 命中时返回 304"""
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": f"public, max-age={max_age}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
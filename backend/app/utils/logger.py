@@ -5,7 +5,17 @@ import logging
 import sys
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
-from datetime import datetime
+
+
+class LazyRotatingFileHandler(RotatingFileHandler):
+    """首次写日志时才创建目录并打开文件，导入本模块没有磁盘副作用"""
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
 
 
 def setup_logger(name: str = "generator", log_level: str = "INFO") -> logging.Logger:
@@ -36,11 +46,10 @@ def setup_logger(name: str = "generator", log_level: str = "INFO") -> logging.Lo
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
     
-    # 文件处理器
+    # 文件处理器 (延迟打开)
     log_dir = Path(__file__).parent.parent.parent / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
     
-    file_handler = RotatingFileHandler(
+    file_handler = LazyRotatingFileHandler(
         log_dir / f"{name}.log",
         maxBytes=10 * 1024 * 1024,  # 10MB
         backupCount=5,
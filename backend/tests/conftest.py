@@ -0,0 +1,51 @@
+"""
+测试公共设置
+
+在导入 app 之前把输出、数据与模板目录指向临时目录，并摘掉日志文件处理器，
+测试不会写入仓库中的 output/、data/ 与 logs/。
+"""
+from pathlib import Path
+from typing import Dict
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_TMP_ROOT = Path(tempfile.mkdtemp(prefix="generator-tests-"))
+atexit.register(shutil.rmtree, _TMP_ROOT, ignore_errors=True)
+os.environ.setdefault("OUTPUT_DIR", str(_TMP_ROOT / "output"))
+os.environ.setdefault("DATA_DIR", str(_TMP_ROOT / "data"))
+os.environ.setdefault("TEMPLATES_DIR", str(_TMP_ROOT / "templates"))
+
+import pytest  # noqa: E402
+
+from app.core.storage import LocalArtifactStore, build_archive, file_sha256  # noqa: E402
+from app.utils.logger import logger  # noqa: E402
+
+# 测试日志只输出到控制台 (由 pytest 捕获)，不写 logs/generator.log
+for _handler in [h for h in logger.handlers if isinstance(h, logging.FileHandler)]:
+    logger.removeHandler(_handler)
+
+
+@pytest.fixture
+def store(tmp_path) -> LocalArtifactStore:
+    return LocalArtifactStore(tmp_path / "output")
+
+
+def publish_project(store: LocalArtifactStore, project_id: str, files: Dict[str, bytes]) -> Path:
+    """按引擎的顺序暂存、登记、打包并发布一个项目，返回项目目录"""
+    staging_dir = store.new_staging_dir(project_id)
+    output_dir = staging_dir / "project"
+    for rel, data in files.items():
+        path = output_dir / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    manifest = store.ingest(output_dir)
+    staged_zip = staging_dir / "project.zip"
+    build_archive(output_dir, manifest, staged_zip)
+    return store.publish(project_id, output_dir, staged_zip, file_sha256(staged_zip), manifest)
@@ -0,0 +1,148 @@
+"""准入控制: 令牌桶、各类限流与排队上限、客户端识别"""
+from types import SimpleNamespace
+import asyncio
+
+import pytest
+
+from app.core import admission
+from app.core.admission import AdmissionController, AdmissionRejected, TokenBucket, client_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(admission, "time", clock)
+    return clock
+
+
+def _controller(**kwargs) -> AdmissionController:
+    options = dict(max_concurrent=1, max_queue=2, queue_timeout=0.05, rate_per_minute=0, burst=1,
+                   bulk_queue=10, bulk_timeout=0.05, bulk_rate_per_minute=0, bulk_burst=1,
+                   bulk_queue_per_client=2, reserved_interactive=0)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_token_bucket_burst_then_refill(clock):
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0.0
+    assert not bucket.is_full()
+
+
+def test_token_bucket_caps_at_capacity(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    bucket.try_acquire()
+    clock.now += 100
+    assert bucket.is_full()
+    assert bucket.tokens == 2
+
+
+def test_rate_limit_per_client_and_class(clock):
+    controller = _controller(rate_per_minute=60, burst=2, bulk_rate_per_minute=60, bulk_burst=1)
+    controller.check("a", "interactive")
+    controller.check("a", "interactive")
+    with pytest.raises(AdmissionRejected) as exc:
+        controller.check("a", "interactive")
+    assert exc.value.status_code == 429
+    assert exc.value.retry_after == 1
+    # 其他客户端与其他优先级类各自计数
+    controller.check("b", "interactive")
+    controller.check("a", "batch")
+    with pytest.raises(AdmissionRejected):
+        controller.check("a", "batch")
+    clock.now += 1
+    controller.check("a", "interactive")
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError):
+        _controller().check("a", "urgent")
+
+
+def test_client_queue_cap_and_slot_timeout():
+    async def main():
+        controller = _controller(bulk_queue_per_client=2)
+        scheduler = controller._get_scheduler()
+        await scheduler.acquire("holder", "interactive")
+        queued = [asyncio.create_task(scheduler.acquire("a", "batch")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            controller.check("a", "batch")
+        assert exc.value.status_code == 429
+        controller.check("b", "batch")
+        # 合并到进行中生成的请求不排队，不受排队上限限制
+        controller.check("a", "batch", queued=False)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.admit("b", "batch"):
+                pass
+        assert exc.value.status_code == 503
+        for task in queued:
+            task.cancel()
+        await asyncio.gather(*queued, return_exceptions=True)
+        scheduler.release("interactive")
+        return controller
+
+    controller = asyncio.run(main())
+    metrics = controller.get_metrics()["classes"]["batch"]
+    assert metrics["rejected_total"]["client_queue_full"] == 1
+    assert metrics["rejected_total"]["queue_timeout"] == 1
+    assert metrics["queued"] == 0
+    assert metrics["queued_clients"] == 0
+    scheduler = controller._scheduler
+    assert scheduler.in_use == 0
+    assert scheduler.waiting == {"interactive": 0, "batch": 0, "background": 0}
+
+
+def test_queue_full_rejected_with_503():
+    async def main():
+        controller = _controller(max_queue=1, queue_timeout=5)
+        scheduler = controller._get_scheduler()
+        await scheduler.acquire("holder", "interactive")
+        waiting = asyncio.create_task(scheduler.acquire("a", "interactive"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            controller.check("b", "interactive")
+        assert exc.value.status_code == 503
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+def test_slot_releases_on_error():
+    async def main():
+        controller = _controller()
+        with pytest.raises(RuntimeError):
+            async with controller.admit("a"):
+                raise RuntimeError("boom")
+        return controller._scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.in_use == 0
+    assert scheduler.running["interactive"] == 0
+
+
+def _request(peer, real_ip=None):
+    headers = {"x-real-ip": real_ip} if real_ip else {}
+    return SimpleNamespace(client=SimpleNamespace(host=peer) if peer else None, headers=headers)
+
+
+def test_client_key_trusts_only_configured_proxies():
+    assert client_key(_request("127.0.0.1", "203.0.113.7")) == "203.0.113.7"
+    assert client_key(_request("198.51.100.2", "203.0.113.7")) == "198.51.100.2"
+    assert client_key(_request("198.51.100.2")) == "198.51.100.2"
+    assert client_key(_request(None, "203.0.113.7")) == "unknown"
@@ -0,0 +1,74 @@
+"""增量包: 基础项目 + 增量包 = 新项目"""
+import io
+import json
+import os
+import stat
+import zipfile
+
+import pytest
+
+from app.core.delta import DELTA_MANIFEST, ProjectChanged, build_delta_archive, diff_projects
+from conftest import publish_project
+
+
+BASE = {
+    "README.md": b"# demo\n",
+    "src/app.py": b"print('v1')\n",
+    "src/util.py": b"def f():\n    return 1\n",
+    "static/logo.png": b"\x89PNG" + bytes(range(256)) * 8,
+}
+NEW = {
+    "README.md": b"# demo\n",
+    "src/app.py": b"print('v2')\n",
+    "src/models/student.py": b"class Student:\n    pass\n",
+    "static/logo.png": BASE["static/logo.png"],
+}
+
+
+def _unzip(data: bytes) -> dict:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return {info.filename: zf.read(info) for info in zf.infolist() if not info.is_dir()}
+
+
+def test_delta_round_trip(store, tmp_path):
+    publish_project(store, "base", BASE)
+    publish_project(store, "new", NEW)
+
+    delta = diff_projects(store, "base", "new")
+    assert [e["path"] for e in delta.added] == ["src/models/student.py"]
+    assert [e["path"] for e in delta.changed] == ["src/app.py"]
+    assert delta.deleted == ["src/util.py"]
+
+    zip_path = tmp_path / "delta.zip"
+    build_delta_archive(store, delta, zip_path)
+    patch = _unzip(zip_path.read_bytes())
+    info = json.loads(patch.pop(DELTA_MANIFEST))
+    assert info["deleted"] == ["src/util.py"]
+
+    # 客户端用法: 解压覆盖后删除列出的文件
+    result = _unzip(store.get_archive("base").path.read_bytes())
+    result.update(patch)
+    for path in info["deleted"]:
+        del result[path]
+    assert result == _unzip(store.get_archive("new").path.read_bytes()) == NEW
+
+
+def test_delta_etag_stable_and_same_project_empty(store):
+    publish_project(store, "base", BASE)
+    publish_project(store, "new", NEW)
+    assert diff_projects(store, "base", "new").etag == diff_projects(store, "base", "new").etag
+    same = diff_projects(store, "base", "base")
+    assert same.files == [] and same.deleted == []
+    assert diff_projects(store, "base", "missing") is None
+
+
+def test_delta_detects_changed_file(store, tmp_path):
+    publish_project(store, "base", BASE)
+    project_dir = publish_project(store, "new", NEW)
+    delta = diff_projects(store, "base", "new")
+
+    target = project_dir / "src/app.py"
+    os.chmod(target, stat.S_IMODE(target.stat().st_mode) | stat.S_IWUSR)
+    target.write_bytes(b"print('edited')\n")
+    with pytest.raises(ProjectChanged):
+        build_delta_archive(store, delta, tmp_path / "delta.zip")
@@ -0,0 +1,91 @@
+"""下载接口: Range / If-Range / ETag，本地文件与流式后端行为一致"""
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import generator
+from app.api.generator import _parse_range
+from app.core.storage import SqliteArtifactStore
+from conftest import publish_project
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 100)),
+    ("bytes=100-", (100, 1000)),
+    ("bytes=-100", (900, 1000)),
+    ("bytes=-5000", (0, 1000)),
+    ("bytes=990-5000", (990, 1000)),
+    (" bytes=0-0 ", (0, 1)),
+    ("bytes=1000-", None),
+    ("bytes=5000-6000", None),
+    ("bytes=-0", None),
+    ("bytes=-", None),
+    ("bytes=50-10", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def client(request, tmp_path, store, monkeypatch):
+    if request.param == "sqlite":
+        store = SqliteArtifactStore(tmp_path / "artifacts.db", tmp_path / "staging")
+    publish_project(store, "demo", {f"src/file{i}.txt": bytes([i]) * 4096 for i in range(8)})
+    monkeypatch.setattr(generator, "get_engine", lambda: SimpleNamespace(store=store))
+    app = FastAPI()
+    app.include_router(generator.router, prefix="/api/generator")
+    with TestClient(app) as client:
+        full = client.get("/api/generator/download/demo")
+        assert full.status_code == 200
+        client.archive = full.content
+        client.etag = full.headers["etag"]
+        yield client
+
+
+def test_full_download_and_etag(client):
+    assert client.archive[:2] == b"PK"
+    response = client.get("/api/generator/download/demo", headers={"If-None-Match": client.etag})
+    assert response.status_code == 304
+
+
+def test_range_requests(client):
+    size = len(client.archive)
+    url = "/api/generator/download/demo"
+
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == client.archive[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{size}"
+
+    response = client.get(url, headers={"Range": "bytes=-16"})
+    assert response.status_code == 206
+    assert response.content == client.archive[-16:]
+
+    response = client.get(url, headers={"Range": f"bytes={size - 4}-{size + 100}"})
+    assert response.status_code == 206
+    assert response.content == client.archive[-4:]
+
+    response = client.get(url, headers={"Range": f"bytes={size}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{size}"
+
+
+def test_if_range(client):
+    url = "/api/generator/download/demo"
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": client.etag})
+    assert response.status_code == 206
+    assert response.content == client.archive[:10]
+
+    # 包已变化: 忽略 Range 返回完整内容
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == client.archive
+
+
+def test_missing_project(client):
+    assert client.get("/api/generator/download/nothing").status_code == 404
+    assert client.get("/api/generator/download/..%2Fdemo").status_code == 404
@@ -0,0 +1,88 @@
+"""目标路径: 逃逸输出目录的路径被拒绝，foreach 展开的路径唯一"""
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+from app.core.plan import GenerationPlan, PathTemplate, safe_relpath
+from app.core.storage import check_project_id
+from app.core.template_loader import FileMapping, ModuleDefinition
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("src/main.py", "src/main.py"),
+    ("src/./a/../main.py", "src/main.py"),
+    ("src\\main.py", "src/main.py"),
+    ("a/b/../../c.txt", "c.txt"),
+    ("../evil.txt", None),
+    ("src/../../evil.txt", None),
+    ("..\\evil.txt", None),
+    ("/etc/passwd", None),
+    ("\\\\server\\share", None),
+    ("C:/Windows/evil.txt", None),
+    ("c:evil.txt", None),
+    ("..", None),
+    (".", None),
+    ("", None),
+])
+def test_safe_relpath(path, expected):
+    assert safe_relpath(path) == expected
+
+
+def test_path_template_render():
+    template = PathTemplate("src/{{ package_name | replace('.', '/') }}/{{ entity.class_name }}.java")
+    context = {"package_name": "com.demo", "entity": {"class_name": "Student"}}
+    assert template.render(context) == "src/com/demo/Student.java"
+    assert PathTemplate("{{ missing }}.txt").render({}) == "{{ missing }}.txt"
+    with pytest.raises(ValueError):
+        PathTemplate("{{ item.name }}.txt").render({"item": {}}, strict=True)
+
+
+@pytest.mark.parametrize("project_id", ["../x", "a/b", "a.b", "", "x" * 65, None])
+def test_check_project_id_rejects(project_id):
+    with pytest.raises(ValueError):
+        check_project_id(project_id)
+
+
+@pytest.fixture
+def plan(tmp_path):
+    module_path = tmp_path / "module"
+    (module_path / "templates").mkdir(parents=True)
+    (module_path / "templates" / "item.txt.j2").write_text("{{ item.name }}", encoding="utf-8")
+    (module_path / "templates" / "readme.md.j2").write_text("# {{ project_name }}", encoding="utf-8")
+    module = ModuleDefinition(
+        id="demo", name="demo", description="demo", module_path=module_path,
+        files=[
+            FileMapping(source="templates/readme.md.j2", target="README.md"),
+            FileMapping(source="templates/item.txt.j2", target="items/{{ item.name }}.txt", foreach="items"),
+            FileMapping(source="templates/readme.md.j2", target="../outside.md"),
+        ],
+    )
+    env = Environment(loader=FileSystemLoader(str(module_path)))
+    return GenerationPlan(module, env)
+
+
+def test_plan_skips_static_escape(plan):
+    assert [s["source"] for s in plan.skipped] == ["templates/readme.md.j2"]
+    assert [step.target.source for step in plan.steps] == ["README.md", "items/{{ item.name }}.txt"]
+
+
+def test_build_jobs_rejects_escaping_items(plan, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    items = [{"name": "ok"}, {"name": "../../../evil"}, {"name": "/abs"}, {"name": "sub/../fine"}]
+    jobs, copies = plan.build_jobs({"project_name": "p", "items": items}, output_dir)
+    targets = sorted(job[2].relative_to(output_dir).as_posix() for job in jobs)
+    assert targets == ["README.md", "items/abs.txt", "items/fine.txt", "items/ok.txt"]
+    assert copies == []
+    assert all(output_dir in job[2].parents for job in jobs)
+
+
+def test_build_jobs_rejects_duplicate_and_unresolved_targets(plan, tmp_path):
+    output_dir = tmp_path / "dup"
+    output_dir.mkdir()
+    with pytest.raises(ValueError, match="生成同一个文件"):
+        plan.build_jobs({"items": [{"name": "a"}, {"name": "a"}]}, output_dir)
+
+    output_dir = tmp_path / "missing"
+    output_dir.mkdir()
+    with pytest.raises(ValueError, match="无法求值"):
+        plan.build_jobs({"items": [{"name": "a"}, {"title": "b"}]}, output_dir)
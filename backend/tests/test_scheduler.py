@@ -0,0 +1,135 @@
+"""公平调度器: 类间权重、类内客户端轮转、超时与取消后的计数"""
+import asyncio
+import time
+
+import pytest
+
+from app.core.scheduler import FairScheduler
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _run_in_order(scheduler: FairScheduler, requests):
+    """名额被占满时依次排队 requests [(client, priority)]，返回实际执行顺序"""
+    order = []
+
+    async def worker(client, priority):
+        await scheduler.acquire(client, priority)
+        order.append((client, priority))
+        await asyncio.sleep(0)
+        scheduler.release(priority)
+
+    await scheduler.acquire("holder", "interactive")
+    tasks = [asyncio.create_task(worker(c, p)) for c, p in requests]
+    await _settle()
+    scheduler.release("interactive")
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_clients_take_turns_within_class():
+    scheduler = FairScheduler(capacity=1, reserved_interactive=0)
+    requests = [("a", "batch")] * 5 + [("b", "batch")]
+    order = asyncio.run(_run_in_order(scheduler, requests))
+    # b 只排了一个任务，不必等 a 的 5 个任务全部执行完
+    assert [c for c, _ in order[:2]] == ["a", "b"]
+
+
+def test_interactive_outweighs_batch():
+    scheduler = FairScheduler(capacity=1, reserved_interactive=0)
+    requests = [("a", "batch")] * 10 + [("b", "interactive")] * 10
+    order = asyncio.run(_run_in_order(scheduler, requests))
+    first = [p for _, p in order[:10]]
+    assert 7 <= first.count("interactive") <= 9
+    assert "batch" in first
+
+
+def test_reserved_slot_only_for_interactive():
+    async def main():
+        scheduler = FairScheduler(capacity=2, reserved_interactive=1)
+        await scheduler.acquire("a", "batch")
+        blocked = asyncio.create_task(scheduler.acquire("a", "batch"))
+        await _settle()
+        assert not blocked.done()
+        await asyncio.wait_for(scheduler.acquire("b", "interactive"), 1)
+        assert scheduler.running == {"interactive": 1, "batch": 1, "background": 0}
+        blocked.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await blocked
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.waiting["batch"] == 0
+    assert scheduler.waiting_for("batch", "a") == 0
+
+
+def test_counters_after_timeout():
+    async def main():
+        scheduler = FairScheduler(capacity=1)
+        await scheduler.acquire("holder", "interactive")
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.acquire("a", "batch", time.monotonic() + 0.05)
+        assert scheduler.waiting["batch"] == 0
+        assert scheduler.waiting_for("batch", "a") == 0
+        scheduler.release("interactive")
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.in_use == 0
+    assert scheduler.running["batch"] == 0
+    assert scheduler.queued_clients("batch") == 0
+
+
+def test_expired_deadline_not_dispatched():
+    async def main():
+        scheduler = FairScheduler(capacity=1, reserved_interactive=0)
+        await scheduler.acquire("holder", "batch")
+        late = asyncio.create_task(scheduler.acquire("a", "batch", time.monotonic() + 0.05))
+        other = asyncio.create_task(scheduler.acquire("b", "batch"))
+        await asyncio.sleep(0.1)
+        scheduler.release("batch")
+        await asyncio.wait_for(other, 1)
+        with pytest.raises(asyncio.TimeoutError):
+            await late
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.in_use == 1
+    assert scheduler.running["batch"] == 1
+    assert scheduler.waiting["batch"] == 0
+
+
+@pytest.mark.parametrize("settle_before_cancel", [False, True])
+def test_counters_after_cancel(settle_before_cancel):
+    """调用方在排队中或刚分到名额时被取消，名额与排队数都要归还"""
+    async def main():
+        scheduler = FairScheduler(capacity=1)
+
+        async def job():
+            await scheduler.acquire("a", "interactive")
+            try:
+                await asyncio.sleep(10)
+            finally:
+                scheduler.release("interactive")
+
+        await scheduler.acquire("holder", "interactive")
+        tasks = [asyncio.create_task(job()) for _ in range(3)]
+        await _settle()
+        assert scheduler.waiting_for("interactive", "a") == 3
+        # 归还名额时第一个等待者分到名额，但其任务尚未恢复执行
+        scheduler.release("interactive")
+        if settle_before_cancel:
+            await _settle()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    assert scheduler.in_use == 0
+    assert scheduler.running["interactive"] == 0
+    assert scheduler.waiting["interactive"] == 0
+    assert scheduler.waiting_for("interactive", "a") == 0
@@ -0,0 +1,55 @@
+"""本地存储: 原子发布与去重文件的隔离"""
+import io
+import os
+import stat
+import zipfile
+
+import pytest
+
+from app.core.storage import file_sha256
+from conftest import publish_project
+
+
+def test_republish_switches_whole_release(store):
+    first = publish_project(store, "demo", {"a.txt": b"1"})
+    first_archive = store.get_archive("demo")
+    second = publish_project(store, "demo", {"a.txt": b"2", "b.txt": b"3"})
+
+    assert first == second and (second / "b.txt").exists()
+    archive = store.get_archive("demo")
+    assert archive.sha256 != first_archive.sha256
+    assert file_sha256(archive.path) == archive.sha256
+    assert [e["path"] for e in store.list_files("demo")] == ["a.txt", "b.txt"]
+    with store.open_file("demo", "a.txt") as f:
+        assert f.read() == b"2"
+    # 已解析到旧版本的读取方仍能读完
+    assert file_sha256(first_archive.path) == first_archive.sha256
+
+
+def test_deduplicated_files_are_read_only(store):
+    project_dir = publish_project(store, "a", {"same.txt": b"shared"})
+    publish_project(store, "b", {"same.txt": b"shared"})
+    path = project_dir / "same.txt"
+    assert path.stat().st_nlink == 3
+    assert not path.stat().st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+    with zipfile.ZipFile(io.BytesIO(store.get_archive("a").path.read_bytes())) as zf:
+        mode = zf.getinfo("same.txt").external_attr >> 16
+    assert mode & stat.S_IWUSR
+
+
+@pytest.mark.parametrize("restore_mode", [False, True])
+def test_modified_blob_not_reused(store, restore_mode):
+    project_dir = publish_project(store, "a", {"same.txt": b"shared"})
+    path = project_dir / "same.txt"
+    os.chmod(path, 0o644)
+    path.write_bytes(b"edited")
+    if restore_mode:
+        # 改回只读后仍可由大小与修改时间发现
+        os.chmod(path, 0o444)
+
+    new_dir = publish_project(store, "b", {"same.txt": b"shared"})
+    assert (new_dir / "same.txt").read_bytes() == b"shared"
+    assert not os.path.samefile(path, new_dir / "same.txt")
+    manifest = {e["path"]: e for e in store.list_files("b")}
+    assert file_sha256(new_dir / "same.txt") == manifest["same.txt"]["sha256"]
@@ -1,77 +1,474 @@
-import asyncio
+"""
+中国学生作业代码生成器 - 命令行工具
+
+非交互式，适合脚本和夜间流水线:
+
+    python cli.py list
+    python cli.py generate student_management --set project_name=Demo
+    python cli.py batch student_management roster.csv --id-field student_id --workers 8
+    python cli.py profile-import app.main --top 20
+    python cli.py bench-startup --runs 5
+
+配置文件支持 JSON / YAML / CSV，每条记录生成一个项目 (CSV 每行一条)。
+
+退出码:
+    0  全部成功
+    1  部分或全部生成失败 / 启动耗时超出阈值
+    2  参数或配置文件错误
+"""
+import argparse
+import csv
 import json
 import os
+import re
+import statistics
+import subprocess
 import sys
+import time
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 # 将 backend 目录添加到路径
-sys.path.append(str(Path(__file__).parent / "backend"))
+BACKEND_DIR = Path(__file__).parent / "backend"
+sys.path.append(str(BACKEND_DIR))
 
-from app.core.engine import GeneratorEngine
-from app.api.modules import AVAILABLE_MODULES
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
 
-async def main():
-    print("🚀 中国学生作业代码生成器 - 终端测试工具")
-    print("-" * 40)
-    
-    # 1. 选择模块
-    print("\n可用模块:")
-    for i, mod in enumerate(AVAILABLE_MODULES):
-        print(f"{i + 1}. [{mod.id}] {mod.name} - {mod.description}")
+# 冷启动耗时阈值 (毫秒): 在全新解释器中导入该模块的耗时
+STARTUP_BUDGETS_MS = {
+    "app.core.engine": 400,  # CLI / 工作进程路径
+    "app.main": 800,  # Web 服务路径
+}
+
+# 每个工作进程一个引擎实例
+_engine = None
+
+
+def _init_worker(log_level: str):
+    """工作进程初始化: 设置日志级别"""
+    from app.utils.logger import logger
+    logger.setLevel(log_level)
+
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        from app.core.engine import GeneratorEngine
+        _engine = GeneratorEngine()
+    return _engine
+
+
+def _generate_one(module_id: str, config: Dict[str, Any], project_id: Optional[str]) -> Dict[str, Any]:
+    """在当前进程中生成一个项目"""
+    import asyncio
     
-    try:
-        choice = int(input("\n请选择模块编号: ")) - 1
-        if choice < 0 or choice >= len(AVAILABLE_MODULES):
-            print("❌ 无效选择")
-            return
-    except ValueError:
-        print("❌ 输入有误")
+    result = asyncio.run(_get_engine().generate(
+        module_id=module_id,
+        config=config,
+        project_id=project_id
+    ))
+    data = result.to_dict()
+    data["output_path"] = str(result.output_path) if result.output_path else None
+    return data
+
+
+def _coerce(value: str, field) -> Any:
+    """把 CSV/命令行中的字符串按字段类型转换"""
+    if field is None:
+        return value
+    if field.type == "checkbox":
+        return [v.strip() for v in value.split(",") if v.strip()]
+    if field.type == "list":
+        return json.loads(value)
+    if field.type == "number":
+        return float(value) if "." in value else int(value)
+    return value
+
+
+def load_configs(path: Path, module) -> List[Dict[str, Any]]:
+    """
+    读取批量配置文件
+
+    Args:
+        path: JSON / YAML / CSV 文件
+        module: 模块定义，用于 CSV 字段类型转换
+
+    Returns:
+        配置列表
+    """
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        fields = {f.name: f for f in module.fields}
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            # 空单元格不覆盖模块默认值
+            return [
+                {k: _coerce(v, fields.get(k)) for k, v in row.items() if k and v not in (None, "")}
+                for row in csv.DictReader(f)
+            ]
+
+    with open(path, "r", encoding="utf-8") as f:
+        if suffix in (".yaml", ".yml"):
+            import yaml
+            data = yaml.safe_load(f)
+        elif suffix == ".json":
+            data = json.load(f)
+        else:
+            raise ValueError(f"不支持的配置文件格式: {path.suffix}")
+
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(d, dict) for d in data):
+        raise ValueError("配置文件应为对象或对象列表")
+    return data
+
+
+def _progress(done: int, total: int, failed: int, start: float):
+    """在 stderr 绘制进度条"""
+    if not sys.stderr.isatty():
         return
+    width = 30
+    filled = int(width * done / total) if total else width
+    elapsed = time.time() - start
+    bar = "█" * filled + "░" * (width - filled)
+    sys.stderr.write(f"\r[{bar}] {done}/{total}  失败 {failed}  {elapsed:.1f}s")
+    if done == total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+CUSTOM_ID_RULE = "只允许字母、数字、- 和 _，最长 64 个字符，且不能是 32 位十六进制 (保留给自动生成的ID)"
+
+
+def is_custom_project_id(project_id: str) -> bool:
+    """
+    指定的项目ID是否可用
+
+    32 位十六进制的ID保留给引擎自动分配: 下载接口对这类ID长期缓存，
+    指定ID会被重新发布，不能与之混淆。
+    """
+    from app.core.storage import is_valid_project_id, is_generated_project_id
+
+    return is_valid_project_id(project_id) and not is_generated_project_id(project_id)
+
+
+def roster_project_id(config: Dict[str, Any], id_field: Optional[str]) -> Optional[str]:
+    """从配置记录中取项目ID，未指定 id_field 或为空时返回 None (自动生成)"""
+    if id_field and config.get(id_field) not in (None, ""):
+        return str(config[id_field])
+    return None
+
+
+def run_batch(
+    module_id: str,
+    configs: List[Dict[str, Any]],
+    id_field: Optional[str] = None,
+    workers: int = 1,
+    log_level: str = "WARNING"
+) -> List[Dict[str, Any]]:
+    """
+    并行批量生成
+
+    workers > 1 时使用进程池，按 CPU 核数扩展；结果顺序与输入一致。
+    """
+    jobs = []
+    for config in configs:
+        jobs.append((module_id, config, roster_project_id(config, id_field)))
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+    failed = 0
+    start = time.time()
+
+    # 同一名单中重复的ID会互相覆盖: 只生成第一条，其余记为失败
+    pending = []
+    first_seen: Dict[str, int] = {}
+    for index, (_, _, project_id) in enumerate(jobs):
+        if project_id is not None and project_id in first_seen:
+            results[index] = {
+                "success": False,
+                "project_id": project_id,
+                "error": f"项目ID与第 {first_seen[project_id] + 1} 条重复",
+                "duration": 0.0
+            }
+            failed += 1
+        else:
+            if project_id is not None:
+                first_seen[project_id] = index
+            pending.append(index)
+
+    _progress(len(jobs) - len(pending), len(jobs), failed, start)
+
+    def record(index: int, data: Dict[str, Any]):
+        nonlocal failed
+        results[index] = data
+        if not data["success"]:
+            failed += 1
+        _progress(sum(r is not None for r in results), len(jobs), failed, start)
+
+    if workers <= 1:
+        for index in pending:
+            record(index, _generate_one(*jobs[index]))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
         
-    selected_module = AVAILABLE_MODULES[choice]
-    print(f"✅ 已选择: {selected_module.name}")
-    
-    # 2. 配置参数
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(log_level,)
+        ) as pool:
+            futures = {pool.submit(_generate_one, *jobs[index]): index for index in pending}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    data = {"success": False, "project_id": jobs[index][2], "error": str(e), "duration": 0.0}
+                record(index, data)
+
+    return results
+
+
+def print_summary(results: List[Dict[str, Any]], wall: float):
+    """打印耗时与失败汇总"""
+    ok = [r for r in results if r["success"]]
+    failed = [(i, r) for i, r in enumerate(results) if not r["success"]]
+    durations = [r["duration"] for r in ok]
+
+    print("-" * 40)
+    print(f"✅ 成功: {len(ok)}    ❌ 失败: {len(failed)}    总数: {len(results)}")
+    print(f"⏱️ 总耗时 {wall:.2f}s, 吞吐 {len(results) / wall if wall else 0:.1f} 个/秒")
+    if durations:
+        print(f"   单个耗时 平均 {sum(durations) / len(durations):.2f}s"
+              f"  p50 {_percentile(durations, 0.5):.2f}s"
+              f"  p95 {_percentile(durations, 0.95):.2f}s"
+              f"  最大 {max(durations):.2f}s")
+    for index, r in failed:
+        print(f"   ✗ 第 {index + 1} 条 [{r.get('project_id')}]: {r.get('error')}")
+
+
+def cmd_list(args) -> int:
+    for m in _get_engine().get_modules():
+        print(f"[{m.id}] {m.name} - {m.description}")
+    return EXIT_OK
+
+
+def cmd_generate(args) -> int:
+    engine = _get_engine()
+    module = engine.get_module(args.module_id)
+    if not module:
+        print(f"❌ 模块不存在: {args.module_id}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.project_id is not None and not is_custom_project_id(args.project_id):
+        print(f"❌ 非法的项目ID: {args.project_id} ({CUSTOM_ID_RULE})", file=sys.stderr)
+        return EXIT_USAGE
+
+    fields = {f.name: f for f in module.fields}
     config = {}
-    print("\n请输入配置参数 (直接按回车使用默认值):")
-    for field in selected_module.fields:
-        default_val = field.default if field.default is not None else ""
-        prompt = f"[{field.label}]"
-        if default_val:
-            prompt += f" (默认: {default_val})"
-        val = input(f"{prompt}: ").strip()
-        
-        if not val and field.default is not None:
-            config[field.name] = field.default
-        else:
-            # 简单类型转换
-            if field.type == "checkbox":
-                config[field.name] = val.split(",") if val else field.default
-            else:
-                config[field.name] = val
-
-    # 3. 执行生成
-    print("\n⚙️ 正在生成项目...")
-    engine = GeneratorEngine()
-    project_id = f"test_{selected_module.id}"
-    
-    result = await engine.generate(
-        module_id=selected_module.id,
-        config=config,
-        project_id=project_id
-    )
-    
-    if result["success"]:
-        output_path = Path(__file__).parent / "output" / project_id
-        print(f"\n🎉 生成成功！")
-        print(f"📂 项目路径: {output_path.absolute()}")
-        print(f"📦 ZIP包路径: {output_path.with_suffix('.zip').absolute()}")
-        print(f"📄 文件总数: {result.get('files_count', 0)}")
+    for item in args.set or []:
+        if "=" not in item:
+            print(f"❌ --set 参数格式应为 key=value: {item}", file=sys.stderr)
+            return EXIT_USAGE
+        key, value = item.split("=", 1)
+        config[key] = _coerce(value, fields.get(key))
+
+    result = _generate_one(module.id, config, args.project_id)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    elif result["success"]:
+        print(f"🎉 生成成功: {result['project_id']}")
+        print(f"📂 项目路径: {result['output_path']}")
+        print(f"📄 文件总数: {result['files_count']}")
     else:
-        print(f"\n❌ 生成失败: {result.get('error')}")
+        print(f"❌ 生成失败: {result['error']}", file=sys.stderr)
+    return EXIT_OK if result["success"] else EXIT_FAILED
+
+
+def cmd_batch(args) -> int:
+    engine = _get_engine()
+    module = engine.get_module(args.module_id)
+    if not module:
+        print(f"❌ 模块不存在: {args.module_id}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        configs = load_configs(Path(args.config_file), module)
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取配置失败: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if not configs:
+        print("⚠️ 配置文件为空", file=sys.stderr)
+        return EXIT_OK
+
+    if args.id_field:
+        invalid = [
+            (index, project_id) for index, project_id in
+            ((i, roster_project_id(c, args.id_field)) for i, c in enumerate(configs))
+            if project_id is not None and not is_custom_project_id(project_id)
+        ]
+        for index, project_id in invalid:
+            print(f"❌ 第 {index + 1} 条的 {args.id_field} 不能用作项目ID: {project_id}", file=sys.stderr)
+        if invalid:
+            print(f"   {CUSTOM_ID_RULE}", file=sys.stderr)
+            return EXIT_USAGE
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(configs)))
+    print(f"⚙️ {module.name}: {len(configs)} 个项目, {workers} 个进程")
+
+    start = time.time()
+    results = run_batch(
+        module.id,
+        configs,
+        id_field=args.id_field,
+        workers=workers,
+        log_level=args.log_level
+    )
+    wall = time.time() - start
+
+    print_summary(results, wall)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"wall_time": wall, "results": results}, f, ensure_ascii=False, indent=2)
+
+    return EXIT_OK if all(r["success"] for r in results) else EXIT_FAILED
+
+
+def _run_python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    """在全新解释器中执行代码，工作目录与导入路径同后端服务"""
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=str(BACKEND_DIR), env=env, capture_output=True, text=True
+    )
+
+
+def profile_imports(module: str) -> List[Tuple[str, int, int]]:
+    """
+    用 -X importtime 统计导入耗时
+
+    Returns:
+        (模块名, 自身微秒, 累计微秒) 列表，按输出顺序
+    """
+    proc = _run_python(f"import {module}", "-X", "importtime")
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "导入失败")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2))))
+    return rows
+
+
+def measure_startup(module: str) -> float:
+    """在全新解释器中导入模块，返回耗时 (毫秒)"""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; print((time.perf_counter() - t) * 1000)"
+    )
+    proc = _run_python(code)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "导入失败")
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def cmd_profile_import(args) -> int:
+    try:
+        rows = profile_imports(args.module)
+    except RuntimeError as e:
+        print(f"❌ 导入 {args.module} 失败: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    index = 2 if args.sort == "cumulative" else 1
+    total = next((cumulative for name, _, cumulative in rows if name == args.module), 0)
+    print(f"⏱️ import {args.module}: {total / 1000:.1f} ms, 共 {len(rows)} 个模块")
+    print(f"{'自身(ms)':>10} {'累计(ms)':>10}  模块")
+    for row in sorted(rows, key=lambda r: r[index], reverse=True)[:args.top]:
+        print(f"{row[1] / 1000:>10.1f} {row[2] / 1000:>10.1f}  {row[0]}")
+    return EXIT_OK
+
+
+def cmd_bench_startup(args) -> int:
+    budgets = dict(STARTUP_BUDGETS_MS)
+    if args.module:
+        budgets = {args.module: args.max_ms or budgets.get(args.module, 0)}
+    elif args.max_ms:
+        budgets = {module: args.max_ms for module in budgets}
+
+    failed = False
+    for module, budget in budgets.items():
+        try:
+            samples = [measure_startup(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"❌ 导入 {module} 失败: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        # 取中位数，排除首次磁盘缓存未命中的干扰
+        median = statistics.median(samples)
+        over = bool(budget) and median > budget
+        failed = failed or over
+        limit = f"{budget:g}" if budget else "-"
+        print(f"{'❌' if over else '✅'} {module}: 中位数 {median:.0f} ms"
+              f" (最小 {min(samples):.0f}, 最大 {max(samples):.0f}, 阈值 {limit} ms)")
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="中国学生作业代码生成器 - 命令行工具")
+    parser.add_argument("-v", "--verbose", dest="log_level", action="store_const",
+                        const="INFO", default="WARNING", help="输出详细日志")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="列出可用模块")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("generate", help="生成单个项目")
+    p.add_argument("module_id")
+    p.add_argument("--set", action="append", metavar="KEY=VALUE", help="覆盖字段值，可重复")
+    p.add_argument("--project-id", help="指定项目ID (字母、数字、- 和 _，最长 64 个字符)")
+    p.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("batch", help="按配置文件批量生成")
+    p.add_argument("module_id")
+    p.add_argument("config_file", help="JSON / YAML / CSV 配置文件")
+    p.add_argument("--id-field", help="用作项目ID的字段 (如学号列)，重复的ID记为失败")
+    p.add_argument("--workers", type=int, default=0, help="进程数，默认CPU核数")
+    p.add_argument("--report", help="将结果写入 JSON 文件")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("profile-import", help="分析模块导入耗时")
+    p.add_argument("module", nargs="?", default="app.main", help="默认 app.main")
+    p.add_argument("--top", type=int, default=25, help="显示前 N 个模块")
+    p.add_argument("--sort", choices=["cumulative", "self"], default="cumulative", help="排序方式")
+    p.set_defaults(func=cmd_profile_import)
+
+    p = sub.add_parser("bench-startup", help="测量冷启动耗时，超出阈值时退出码为 1")
+    p.add_argument("--module", help="只测量该模块")
+    p.add_argument("--runs", type=int, default=5, help="每个模块的测量次数")
+    p.add_argument("--max-ms", type=float, default=0, help="覆盖默认阈值 (毫秒)")
+    p.set_defaults(func=cmd_bench_startup)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    _init_worker(args.log_level)
+    return args.func(args)
+
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
+        import asyncio
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
+    sys.exit(main())